@@ -10,12 +10,12 @@ import time
 from urllib.parse import urlencode
 
 from tornado import ioloop
-from tornado.escape import json_decode
 from tornado.httpclient import AsyncHTTPClient
 
 from brewery.brewhouse import Brewhouse
 from git import Repo
 from http_codes import HTTP_TIMEOUT
+from joulia_webserver import serialization
 from joulia_webserver.client import JouliaHTTPClient
 from joulia_webserver.client import JouliaWebsocketClient
 import settings
@@ -131,7 +131,7 @@ class System(object):
                 response.rethrow()
         else:
             LOGGER.info("Got command to start brewing session.")
-            response = json_decode(response.body)
+            response = serialization.loads(response.body)
             recipe_instance = response['recipe_instance']
             # Cancel checking for updates when starting a brew session.
             self.update_manager.stop()
@@ -3,21 +3,30 @@ communication with joulia-webserver, and offers an opportunity for subclassing
 and stubbing the response from joulia-webserver.
 """
 
+from collections import OrderedDict
 from collections import namedtuple
 import datetime
-import json
+import functools
 import logging
+import random
+import time
+from urllib.parse import urlencode
 
+from joulia_webserver import serialization
 from joulia_webserver.models import MashStep
 from joulia_webserver.models import MashProfile
 from joulia_webserver.models import Recipe
 from joulia_webserver.models import RecipeInstance
-import pytz
 import requests
+from requests.adapters import HTTPAdapter
 from tornado import gen
+from tornado.httpclient import AsyncHTTPClient
+from tornado.httpclient import HTTPError
 from tornado.httpclient import HTTPRequest
 from tornado.ioloop import IOLoop
+from tornado.websocket import WebSocketClosedError
 from tornado.websocket import websocket_connect
+from urllib3.util.retry import Retry
 
 LOGGER = logging.getLogger(__name__)
 
@@ -25,6 +34,79 @@ LOGGER = logging.getLogger(__name__)
 VALUE_VARIABLE_TYPE = 'value'
 OVERRIDE_VARIABLE_TYPE = 'override'
 
+IDENTIFY_PATH = "/live/timeseries/identify/"
+UPDATE_SENSOR_VALUE_PATH = "/live/timeseries/new/"
+
+
+# Date and whole-second portion of the most recent sample time, which only
+# changes once a second, so is only formatted once a second.
+_sample_time_cache = {'second': None, 'prefix': None}
+
+
+def _sample_time():
+    """Returns the current UTC time as an ISO 8601 string for timestamping
+    sensor samples. Only the microseconds are formatted per call; the rest of
+    the timestamp is reused from the cache until the second rolls over.
+    """
+    now = time.time()
+    second = int(now)
+    if second != _sample_time_cache['second']:
+        _sample_time_cache['prefix'] = datetime.datetime.fromtimestamp(
+            second, tz=datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+        _sample_time_cache['second'] = second
+    microsecond = int((now - second) * 1e6)
+    return '%s.%06d+00:00' % (_sample_time_cache['prefix'], microsecond)
+
+
+def _jittered(backoff):
+    """Picks a random wait between half of and the full ``backoff``, so
+    clients failing at the same time don't all retry in lockstep.
+    """
+    return backoff * random.uniform(0.5, 1.0)
+
+
+def _create_requests_session():
+    """Creates a requests Session, which keeps connections to the server alive
+    and pools them, so each request does not pay for a new TCP and TLS
+    handshake. Idempotent requests failing with a connection error or a
+    transient gateway error are retried a few times with a short backoff. Once
+    the retries run out, the last response is returned rather than raised, so
+    its error status is still reported by ``JouliaHTTPClient``.
+    """
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.1,
+                  status_forcelist=(502, 503, 504), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8,
+                          max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+@functools.lru_cache(maxsize=256)
+def _subscribe_message(recipe_instance, sensor, history_time):
+    """Encodes a websocket request to subscribe to a sensor. Cached, since the
+    same subscriptions are requested again each time the websocket reconnects.
+    """
+    data = {
+        'recipe_instance': recipe_instance,
+        'sensor': sensor,
+        'subscribe': True,
+    }
+    if history_time is not None:
+        data['history_time'] = history_time
+    return serialization.dumps(data)
+
+
+def _sample_message(sample_time, recipe_instance, value, sensor):
+    """Encodes a websocket message sending a single sensor sample."""
+    return serialization.dumps({
+        'time': sample_time,
+        'recipe_instance': recipe_instance,
+        'value': value,
+        'sensor': sensor,
+    })
+
 
 class JouliaWebserverClientBase(object):
     """Abstract class for clients connecting to Joulia Webserver.
@@ -37,6 +119,20 @@ class JouliaWebserverClientBase(object):
         self.address = address
         self.auth_token = auth_token
 
+    @property
+    def auth_token(self):
+        return self._auth_token
+
+    @auth_token.setter
+    def auth_token(self, auth_token):
+        # The headers only change with the token, so they are built here,
+        # rather than for every request.
+        self._auth_token = auth_token
+        if auth_token is not None:
+            self._headers = {'Authorization': 'Token ' + auth_token}
+        else:
+            self._headers = {}
+
     def identify(self, sensor_name, recipe_instance, variable_type):
         """Sends a request to the server based on the current recipe instance
         to identify the sensors id number, given the `sensor_name`
@@ -62,31 +158,112 @@ class JouliaWebserverClientBase(object):
         """
         raise NotImplementedError()
 
+    def update_sensor_values(self, recipe_instance, values):
+        """Sends the current values for several sensors to the server, all
+        sampled at the same time. Clients able to send many samples in a
+        single request should override this; by default each sample is sent
+        separately through ``update_sensor_value``.
+
+        Args:
+            recipe_instance: The recipe instance id to associate the
+                measurements with
+            values: An iterable of (sensor, value) pairs, where sensor is the
+                sensor id for the equipment sampled and value is the sample.
+        """
+        for sensor, value in values:
+            self.update_sensor_value(recipe_instance, value, sensor)
+
+    def update_sensor_samples(self, samples):
+        """Sends samples that were already timestamped, such as ones that
+        could not be sent over another connection. By default, each is sent
+        through ``update_sensor_value``, which timestamps it again.
+
+        Args:
+            samples: An iterable of (time, recipe_instance, value, sensor)
+                samples, where time is the ISO 8601 time it was sampled.
+        """
+        for _, recipe_instance, value, sensor in samples:
+            self.update_sensor_value(recipe_instance, value, sensor)
+
     @staticmethod
     def clean_value(value):
-        """Returns a cleaned value that will be appropriately interpreted."""
+        """Returns a cleaned value that will be appropriately interpreted.
+
+        Samples are all sent to the server as floats, which also maps booleans
+        onto 1.0 and 0.0.
+        """
         if value is None:  # TODO: make server accept None
-            return 0
-        if value is True:
-            return 1
-        if value is False:
-            return 0
-        return value
+            return 0.0
+        return float(value)
 
     def _authorization_headers(self):
-        """Generates authorization headers for the instance."""
-        if self.auth_token is not None:
-            headers = {'Authorization': 'Token ' + self.auth_token}
-        else:
-            headers = {}
-        return headers
+        """Returns the authorization headers for the instance. The same dict is
+        returned on each call, so it must not be modified; pass a copy to
+        anything that adds headers to it, like tornado's HTTP clients.
+        """
+        return self._headers
 
 
 class JouliaHTTPClient(JouliaWebserverClientBase):
     """Client for interacting with Joulia Webserver REST endpoints and websocket
     endpoints.
     """
-    _requests_service = requests
+    _requests_service = _create_requests_session()
+    # Created lazily, so it binds to the IOLoop running when it's first used.
+    _async_http_service = None
+    # Most sensor value posts in flight at once. Samples for every sensor are
+    # posted each tick, so this is larger than tornado's default of 10.
+    MAX_ASYNC_HTTP_CLIENTS = 16
+
+    # Connect and read timeouts for blocking requests, which run on the IOLoop,
+    # so a server that stops responding can't stall it indefinitely. (seconds)
+    REQUEST_TIMEOUT = (3.05, 10.0)
+
+    # Most bytes of an error response's body to include in the raised error.
+    ERROR_BODY_LIMIT = 256
+
+    # Bounds on the time to stop sending sensor values after a failed update,
+    # which doubles for each consecutive failure. (seconds)
+    MIN_UPDATE_BACKOFF = 1.0
+    MAX_UPDATE_BACKOFF = 60.0
+
+    def __init__(self, address, auth_token=None):
+        super(JouliaHTTPClient, self).__init__(address, auth_token=auth_token)
+        # Built once, since they are requested for every sensor identified or
+        # updated.
+        self._identify_url = address + IDENTIFY_PATH
+        self._update_sensor_value_url = address + UPDATE_SENSOR_VALUE_PATH
+        self._update_sensor_value_body_prefixes = {}
+        # The most recently posted sample time and its url encoded field.
+        self._encoded_sample_time = (None, None)
+        # Sensor ids already identified, keyed by (sensor name, recipe
+        # instance, variable type).
+        self._identified = {}
+
+        self._update_backoff = self.MIN_UPDATE_BACKOFF
+        self._next_update_time = 0.0
+
+    @property
+    def _async_http_client(self):
+        if self._async_http_service is None:
+            # A separate instance from the shared one, so sample posts do not
+            # wait in line behind the brewhouse's long-poll requests.
+            self._async_http_service = AsyncHTTPClient(
+                force_instance=True, max_clients=self.MAX_ASYNC_HTTP_CLIENTS)
+        return self._async_http_service
+
+    @classmethod
+    def _raise_for_status(cls, response):
+        """Raises a RuntimeError if the response has an error status, with
+        the start of the body, rather than decoding all of it, which can be a
+        large error page.
+        """
+        try:
+            response.raise_for_status()
+        except requests.HTTPError as e:
+            body = response.content[:cls.ERROR_BODY_LIMIT]
+            raise RuntimeError("{}: {}".format(
+                e, body.decode('utf-8', errors='replace')))
 
     def _post(self, url, *args, **kwargs):
         """Helper function to help make posts to the server but add time
@@ -99,12 +276,10 @@ class JouliaHTTPClient(JouliaWebserverClientBase):
             **kwargs: To pass to `requests.post`
         """
         headers = self._authorization_headers()
+        kwargs.setdefault('timeout', self.REQUEST_TIMEOUT)
         response = self._requests_service.post(url, headers=headers, *args,
                                                **kwargs)
-        try:
-            response.raise_for_status()
-        except requests.HTTPError as e:
-            raise RuntimeError("{}: {}".format(e, response.text))
+        self._raise_for_status(response)
         return response
 
     def _put(self, url, *args, **kwargs):
@@ -118,12 +293,10 @@ class JouliaHTTPClient(JouliaWebserverClientBase):
             **kwargs: To pass to `requests.put`
         """
         headers = self._authorization_headers()
+        kwargs.setdefault('timeout', self.REQUEST_TIMEOUT)
         response = self._requests_service.put(url, headers=headers, *args,
                                               **kwargs)
-        try:
-            response.raise_for_status()
-        except requests.HTTPError as e:
-            raise RuntimeError("{}: {}".format(e, response.text))
+        self._raise_for_status(response)
         return response
 
     def _get(self, url, *args, **kwargs):
@@ -135,12 +308,10 @@ class JouliaHTTPClient(JouliaWebserverClientBase):
             **kwargs: To pass to `requests.post`
         """
         headers = self._authorization_headers()
+        kwargs.setdefault('timeout', self.REQUEST_TIMEOUT)
         response = self._requests_service.get(url, headers=headers, *args,
                                               **kwargs)
-        try:
-            response.raise_for_status()
-        except requests.HTTPError as e:
-            raise RuntimeError("{}: {}".format(e, response.text))
+        self._raise_for_status(response)
         return response
 
     @property
@@ -156,11 +327,19 @@ class JouliaHTTPClient(JouliaWebserverClientBase):
         LOGGER.debug("Brewhouse identified as %d", brewhouse)
         return brewhouse
 
-    @property
-    def _identify_url(self):
-        return self.address + "/live/timeseries/identify/"
-
     def identify(self, sensor_name, recipe_instance, variable_type):
+        """Identifies the sensor like ``JouliaWebserverClientBase.identify``.
+
+        A sensor's id never changes within a recipe instance, so ids are
+        remembered, and identifying the same sensor again, like for another
+        instance or a variable registering again, doesn't go to the server.
+        """
+        key = (sensor_name, recipe_instance, variable_type)
+        try:
+            return self._identified[key]
+        except KeyError:
+            pass
+
         data = {
             'recipe_instance': recipe_instance,
             'name': sensor_name,
@@ -171,20 +350,83 @@ class JouliaHTTPClient(JouliaWebserverClientBase):
         deserialized_response = response.json()
         identifier = deserialized_response['sensor']
         LOGGER.debug("Identified %s as %d", sensor_name, identifier)
+        self._identified[key] = identifier
         return identifier
 
-    @property
-    def _update_sensor_value_url(self):
-        return self.address + "/live/timeseries/new/"
+    def _update_sensor_value_body_prefix(self, recipe_instance, sensor):
+        """Returns the urlencoded fields of a sensor value update that are
+        fixed for a sensor in a recipe instance, encoding them only on the first
+        update.
+        """
+        key = (recipe_instance, sensor)
+        try:
+            return self._update_sensor_value_body_prefixes[key]
+        except KeyError:
+            prefix = urlencode({'recipe_instance': recipe_instance,
+                                'sensor': sensor}) + '&'
+            self._update_sensor_value_body_prefixes[key] = prefix
+            return prefix
 
     def update_sensor_value(self, recipe_instance, value, sensor):
-        sample_time = datetime.datetime.now(tz=pytz.utc).isoformat()
+        # Don't keep building requests for a server that is failing them.
+        if time.monotonic() < self._next_update_time:
+            return
 
-        data = {'time': sample_time,
-                'recipe_instance': recipe_instance,
-                'value': self.clean_value(value),
-                'sensor': sensor}
-        self._post(self._update_sensor_value_url, data=data)
+        self._post_sensor_value(recipe_instance, value, sensor, _sample_time())
+
+    def update_sensor_values(self, recipe_instance, values):
+        """Posts each of the samples, checking whether to back off from a
+        failing server and taking the sample time once for the whole batch.
+        """
+        if time.monotonic() < self._next_update_time:
+            return
+
+        sample_time = _sample_time()
+        for sensor, value in values:
+            self._post_sensor_value(recipe_instance, value, sensor, sample_time)
+
+    def update_sensor_samples(self, samples):
+        """Posts each of the samples with the time it was sampled, checking
+        whether to back off from a failing server once for the whole batch.
+        """
+        if time.monotonic() < self._next_update_time:
+            return
+
+        for sample_time, recipe_instance, value, sensor in samples:
+            self._post_sensor_value(recipe_instance, value, sensor, sample_time)
+
+    def _post_sensor_value(self, recipe_instance, value, sensor, sample_time):
+        """Posts a sensor value sampled at ``sample_time`` to the server."""
+        # Samples in a batch share their time, so it is only encoded once.
+        if sample_time != self._encoded_sample_time[0]:
+            self._encoded_sample_time = (
+                sample_time, urlencode({'time': sample_time}))
+        # Values are always floats, which need no escaping.
+        body = (self._update_sensor_value_body_prefix(recipe_instance, sensor)
+                + self._encoded_sample_time[1] + '&value='
+                + str(self.clean_value(value)))
+        # Posted asynchronously, so the IOLoop keeps running the controller
+        # while waiting on the server.
+        request = HTTPRequest(
+            self._update_sensor_value_url, method="POST", body=body,
+            headers=dict(self._authorization_headers()), connect_timeout=1.0)
+        self._async_http_client.fetch(
+            request, self._handle_update_sensor_value_response)
+
+    def _handle_update_sensor_value_response(self, response):
+        """Logs a failed sensor value update and backs off from sending more
+        for a while. Samples are sent continuously, so a dropped one is not
+        retried.
+        """
+        if response.error:
+            wait = _jittered(self._update_backoff)
+            LOGGER.error("Failed to update sensor value: %s. Pausing updates "
+                         "for %g seconds.", response.error, wait)
+            self._next_update_time = time.monotonic() + wait
+            self._update_backoff = min(
+                2.0 * self._update_backoff, self.MAX_UPDATE_BACKOFF)
+        else:
+            self._update_backoff = self.MIN_UPDATE_BACKOFF
 
     def _get_mash_points_url(self, recipe_pk):
         return "{}/brewery/api/mash_point/?recipe={}".format(self.address,
@@ -309,6 +551,20 @@ class JouliaWebsocketClient(JouliaWebserverClientBase):
         websocket: The tornado websocket client
     """
 
+    # Most samples queued before they are sent without waiting for the end of
+    # the IOLoop iteration.
+    MAX_PENDING_SAMPLES = 128
+
+    # Requests permessage-deflate compression for the websocket, which the
+    # repetitive JSON sample frames compress well under. The connection falls
+    # back to uncompressed frames if the server does not accept it.
+    COMPRESSION_OPTIONS = {}
+
+    # Bounds on the wait between attempts to reconnect to the websocket, which
+    # doubles for each consecutive failure. (seconds)
+    MIN_RECONNECT_BACKOFF = 1.0
+    MAX_RECONNECT_BACKOFF = 60.0
+
     # Represents a simple subscription made to the server for a particular
     # sensor in a recipe_instance.
     Subscription = namedtuple('Subscription', ('recipe_instance', 'sensor',))
@@ -323,6 +579,15 @@ class JouliaWebsocketClient(JouliaWebserverClientBase):
 
         self._subscriptions = set()
 
+        # Samples waiting to be sent in the next flush, keyed by recipe
+        # instance and sensor, so only the latest value for each is sent.
+        self._pending_samples = OrderedDict()
+        self._pending_time = None
+
+        # Future for reconnecting after the connection drops, which resolves
+        # once reconnected.
+        self._reconnecting = None
+
         IOLoop.current().run_sync(self._connect)
 
     @gen.coroutine
@@ -334,33 +599,56 @@ class JouliaWebsocketClient(JouliaWebserverClientBase):
         """
         LOGGER.info("Establishing websocket connection at %s", self.address)
         http_request = HTTPRequest(
-            self.address, headers=self._authorization_headers())
+            self.address, headers=dict(self._authorization_headers()))
         self.websocket = yield self._websocket_connect(
-            http_request, on_message_callback=self.on_message)
+            http_request, on_message_callback=self.on_message,
+            compression_options=self.COMPRESSION_OPTIONS)
         LOGGER.info("Websocket connection established at %s", self.address)
 
     def _reconnect(self):
         """After a connection is dropped, reconnect to the websocket.
 
+        Reconnecting runs on the IOLoop, which is already running when the
+        connection drops, rather than blocking it until the server is back.
         Re-subscribes to any subscriptions made through ``subscribe``.
         """
-        # TODO(willjschmitt): Add re-connect backoff if reconnecting fails
-        # continuously.
-        LOGGER.info("Reconnecting to websocket and re-subscribing.")
-        IOLoop.current().run_sync(self._connect)
+        if self._reconnecting is not None and not self._reconnecting.done():
+            return
+        self._reconnecting = self._reconnect_with_backoff()
+
+    @gen.coroutine
+    def _reconnect_with_backoff(self):
+        """Attempts to reconnect to the websocket until it succeeds, waiting
+        longer after each consecutive failure, then re-subscribes.
+        """
+        backoff = self.MIN_RECONNECT_BACKOFF
+        while True:
+            LOGGER.info("Reconnecting to websocket and re-subscribing.")
+            try:
+                yield self._connect()
+            except (HTTPError, IOError) as e:
+                wait = _jittered(backoff)
+                LOGGER.error("Failed to reconnect to websocket: %s. Retrying "
+                             "in %g seconds.", e, wait)
+                yield gen.sleep(wait)
+                backoff = min(2.0 * backoff, self.MAX_RECONNECT_BACKOFF)
+            else:
+                break
+
         for subscription in self._subscriptions:
-            self.subscribe(subscription.recipe_instance, subscription.sensor,
-                           history_time=0)
+            self.websocket.write_message(_subscribe_message(
+                subscription.recipe_instance, subscription.sensor, 0))
 
     @gen.coroutine
-    def _websocket_connect(self, url, on_message_callback=None):
+    def _websocket_connect(self, url, on_message_callback=None,
+                           compression_options=None):
         websocket = yield websocket_connect(
-            url, on_message_callback=on_message_callback)
+            url, on_message_callback=on_message_callback,
+            compression_options=compression_options)
         return websocket
 
     def write_message(self, message):
-        """Serves as a ``write_message`` api to the websocket. Adds the new
-        message to the queue, and calls the ``empty_queue`` method.
+        """Serves as a ``write_message`` api to the websocket.
 
         Args:
             message: String-like message to send to the websocket
@@ -368,18 +656,78 @@ class JouliaWebsocketClient(JouliaWebserverClientBase):
         self.websocket.write_message(message)
 
     def update_sensor_value(self, recipe_instance, value, sensor):
+        """Queues the sample to be sent once the IOLoop finishes its current
+        iteration, so samples updated together in a control tick share a
+        timestamp, and a sensor updated several times in a tick is only sent
+        once.
+        """
         clean_value = self.clean_value(value)
-        LOGGER.debug("Sending data sample for sensor %s, recipe instance %s: "
-                     "%g (raw: %s)", sensor, recipe_instance, clean_value,
-                     value)
-
-        sample_time = datetime.datetime.now(tz=pytz.utc).isoformat()
-
-        data = {'time': sample_time,
-                'recipe_instance': recipe_instance,
-                'value': clean_value,
-                'sensor': sensor}
-        self.websocket.write_message(json.dumps(data))
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug("Queueing data sample for sensor %s, recipe instance "
+                         "%s: %g (raw: %s)", sensor, recipe_instance,
+                         clean_value, value)
+
+        # Samples queued in the same IOLoop iteration share a time, so a
+        # repeated update for a sensor replaces the last.
+        self._pending_samples[recipe_instance, sensor] = [
+            self._pending_sample_time(), recipe_instance, clean_value, sensor]
+        if len(self._pending_samples) >= self.MAX_PENDING_SAMPLES:
+            self.flush_sensor_values()
+
+    def update_sensor_values(self, recipe_instance, values):
+        """Queues all of the samples to be sent with the others queued in this
+        IOLoop iteration, so DataStreamers polled together share a timestamp.
+        ``values`` may be any iterable, so sending is only scheduled once it
+        has actually queued a sample.
+        """
+        was_empty = not self._pending_samples
+        if was_empty:
+            self._pending_time = _sample_time()
+        sample_time = self._pending_time
+        clean_value = self.clean_value
+        self._pending_samples.update(
+            ((recipe_instance, sensor),
+             [sample_time, recipe_instance, clean_value(value), sensor])
+            for sensor, value in values)
+        if not self._pending_samples:
+            return
+        if was_empty:
+            IOLoop.current().add_callback(self.flush_sensor_values)
+        if len(self._pending_samples) >= self.MAX_PENDING_SAMPLES:
+            self.flush_sensor_values()
+
+    def _pending_sample_time(self):
+        """Returns the time for samples queued in the current IOLoop
+        iteration, which is only built once per iteration. Schedules sending
+        the queued samples when the first one is queued.
+        """
+        if not self._pending_samples:
+            IOLoop.current().add_callback(self.flush_sensor_values)
+            self._pending_time = _sample_time()
+        return self._pending_time
+
+    def flush_sensor_values(self):
+        """Sends all of the queued samples to the server, each in its own
+        message, which is the only form the server accepts samples in.
+        """
+        if not self._pending_samples:
+            return
+        samples = list(self._pending_samples.values())
+        self._pending_samples = OrderedDict()
+        LOGGER.debug("Sending %d data samples.", len(samples))
+
+        write_message = self.websocket.write_message
+        for index, sample in enumerate(samples):
+            try:
+                write_message(_sample_message(*sample))
+            except WebSocketClosedError:
+                # Don't drop the rest of the samples while the websocket
+                # reconnects.
+                unsent = samples[index:]
+                LOGGER.warning("Websocket closed. Sending %d data samples over "
+                               "HTTP.", len(unsent))
+                self.http_client.update_sensor_samples(unsent)
+                return
 
     def identify(self, sensor_name, recipe_instance, variable_type):
         return self.http_client.identify(
@@ -390,31 +738,29 @@ class JouliaWebsocketClient(JouliaWebserverClientBase):
                     recipe_instance)
         self._subscriptions.add(self.Subscription(
             recipe_instance=recipe_instance, sensor=sensor))
-        data = {
-            'recipe_instance': recipe_instance,
-            'sensor': sensor,
-            'subscribe': True,
-        }
-        if history_time is not None:
-            data['history_time'] = history_time
-        msg_string = json.dumps(data)
-        self.websocket.write_message(msg_string)
+        # The reconnect re-subscribes to everything once connected, so don't
+        # send a frame now on the closed websocket.
+        if self._reconnecting is not None and not self._reconnecting.done():
+            return
+        self.websocket.write_message(
+            _subscribe_message(recipe_instance, sensor, history_time))
 
     def register_callback(self, callback):
         """Registers a callback function to be called when a new message is
         received from the websocket.
 
         Args:
-            callback: function to be called when a new message is received.
-                The same arguments received by the standard
-                ``on_message_callback`` callback for the websocket.
+            callback: function to be called when a new message is received,
+                with the message parsed from JSON. Every callback receives the
+                same parsed object, so callbacks must not modify it.
         """
         self.callbacks.add(callback)
 
     def on_message(self, message):
         """Callback called when the websocket receives new data.
 
-        Calls all the registered callback functions with the message supplied.
+        Parses the message once, then calls all the registered callback
+        functions with the parsed message.
 
         Arguments:
             message: the message received from the websocket peer.
@@ -424,5 +770,6 @@ class JouliaWebsocketClient(JouliaWebserverClientBase):
             self._reconnect()
             return
 
+        parsed = serialization.loads(message)
         for callback in self.callbacks:
-            callback(message)
+            callback(parsed)
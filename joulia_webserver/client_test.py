@@ -1,13 +1,25 @@
 """Tests for joulia_webserver.client module."""
 
+import datetime
 import json
+import time
 import unittest
+from unittest.mock import patch
+from urllib.parse import parse_qs
+
+import requests
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.httpclient import AsyncHTTPClient
+from tornado.ioloop import IOLoop
+from tornado.websocket import WebSocketClosedError
 
 from joulia_webserver import client
 from joulia_webserver.client import JouliaHTTPClient
 from joulia_webserver.client import JouliaWebserverClientBase
 from joulia_webserver.client import JouliaWebsocketClient
 from joulia_webserver.models import MashStep
+from testing.stub_async_http_client import StubAsyncHTTPClient
 from testing.stub_joulia_webserver_client import StubJouliaHTTPClient
 from testing.stub_requests import StubRequests
 from testing.stub_websocket import stub_websocket_connect
@@ -18,6 +30,7 @@ class JouliaHTTPClientTest(JouliaHTTPClient):
     def __init__(self, address, auth_token=None):
         # Inject dependencies
         self._requests_service = StubRequests()
+        self._async_http_service = StubAsyncHTTPClient()
 
         super(JouliaHTTPClientTest, self).__init__(
             address, auth_token=auth_token)
@@ -33,6 +46,18 @@ class JouliaWebsocketClientTest(JouliaWebsocketClient):
             address, http_client, auth_token=auth_token)
 
 
+class TestSampleTime(unittest.TestCase):
+    """Tests for the _sample_time function."""
+
+    def test_matches_current_utc_time(self):
+        before = datetime.datetime.utcnow()
+        got = client._sample_time()
+        after = datetime.datetime.utcnow()
+        parsed = datetime.datetime.strptime(got, '%Y-%m-%dT%H:%M:%S.%f+00:00')
+        self.assertLessEqual(before.replace(microsecond=0), parsed)
+        self.assertLessEqual(parsed, after)
+
+
 class TestJouliaWebserverClientBase(unittest.TestCase):
     """Tests JouliaWebserverClientBase."""
 
@@ -84,6 +109,10 @@ class TestJouliaWebserverClientBase(unittest.TestCase):
         want = 13.2
         self.assertAlmostEquals(got, want, 6)
 
+    def test_clean_value_is_float(self):
+        for value in (None, True, False, 11, 13.2):
+            self.assertIsInstance(self.client.clean_value(value), float)
+
     def test_auth_headers_with_token(self):
         client = JouliaHTTPClientTest(self.address, auth_token="faketoken")
 
@@ -98,6 +127,14 @@ class TestJouliaWebserverClientBase(unittest.TestCase):
         want = {}
         self.assertEqual(got, want)
 
+    def test_auth_headers_updated_with_token(self):
+        client = JouliaHTTPClientTest(self.address, auth_token=None)
+        client.auth_token = "faketoken"
+
+        got = client._authorization_headers()
+        want = {'Authorization': 'Token faketoken'}
+        self.assertEqual(got, want)
+
 
 class TestJouliaHttpClient(unittest.TestCase):
     """Tests JouliaHttpClient."""
@@ -106,6 +143,33 @@ class TestJouliaHttpClient(unittest.TestCase):
         self.address = "http://fakehost"
         self.client = JouliaHTTPClientTest(self.address, auth_token=None)
 
+    def test_requests_service_is_persistent_session(self):
+        self.assertIsInstance(JouliaHTTPClient._requests_service,
+                              requests.Session)
+
+    def test_requests_have_timeout(self):
+        self.client._requests_service.response_string = '{"brewhouse": 1}'
+        self.client.get_brewhouse_id()
+        self.assertEquals(self.client._requests_service.last_kwargs["timeout"],
+                          JouliaHTTPClient.REQUEST_TIMEOUT)
+
+    def test_async_http_client_not_shared(self):
+        http_client = JouliaHTTPClient(self.address)
+        got = http_client._async_http_client
+        self.assertIsNot(got, AsyncHTTPClient())
+        self.assertIs(got, http_client._async_http_client)
+        self.assertEquals(got.max_clients,
+                          JouliaHTTPClient.MAX_ASYNC_HTTP_CLIENTS)
+        got.close()
+
+    def test_requests_service_retries(self):
+        adapter = JouliaHTTPClient._requests_service.get_adapter(
+            "https://fakehost")
+        self.assertEqual(adapter.max_retries.total, 3)
+        # Exhausted retries return the last response, so _raise_for_status
+        # raises its RuntimeError for it.
+        self.assertFalse(adapter.max_retries.raise_on_status)
+
     def test_post(self):
         self.client._requests_service.response_string = '{"foo":"bar"}'
         response = self.client._post("fakeurl", data={'baz': 1})
@@ -127,6 +191,19 @@ class TestJouliaHttpClient(unittest.TestCase):
         want = 11
         self.assertEqual(got, want)
 
+    def test_post_error_status(self):
+        self.client._requests_service.status_code = 500
+        self.client._requests_service.reason = "Internal Server Error"
+        self.client._requests_service.response_string = (
+            "x" * (2 * JouliaHTTPClient.ERROR_BODY_LIMIT))
+        with self.assertRaises(RuntimeError) as context:
+            self.client._post("http://fakehost/fakeurl", data={'baz': 1})
+        message = str(context.exception)
+        self.assertIn("500", message)
+        self.assertIn("x" * JouliaHTTPClient.ERROR_BODY_LIMIT, message)
+        self.assertNotIn("x" * (JouliaHTTPClient.ERROR_BODY_LIMIT + 1),
+                         message)
+
     def test_identify_url(self):
         got = self.client._identify_url
         want = "http://fakehost/live/timeseries/identify/"
@@ -141,17 +218,124 @@ class TestJouliaHttpClient(unittest.TestCase):
             sensor_name, recipe_instance, client.OVERRIDE_VARIABLE_TYPE)
         self.assertEqual(sensor_id, 11)
 
+    def test_identify_remembers_ids(self):
+        self.client._requests_service.response_string = '{"sensor":11}'
+        self.client.identify("fake_sensor", 1, client.VALUE_VARIABLE_TYPE)
+
+        # The server isn't asked again, so would fail if it were.
+        self.client._requests_service.server_there = False
+        sensor_id = self.client.identify(
+            "fake_sensor", 1, client.VALUE_VARIABLE_TYPE)
+        self.assertEqual(sensor_id, 11)
+
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.client.identify("fake_sensor", 2, client.VALUE_VARIABLE_TYPE)
+
     def test_update_sensor_value_url(self):
         got = self.client._update_sensor_value_url
         want = "http://fakehost/live/timeseries/new/"
         self.assertEqual(got, want)
 
     def test_update_sensor_value(self):
-        self.client._requests_service.response_string = '{"sensor":11}'
         recipe_instance = 1
         value = 2.0
         sensor_id = 3
         self.client.update_sensor_value(recipe_instance, value, sensor_id)
+        requests_made = self.client._async_http_service.requests
+        self.assertEquals(len(requests_made), 1)
+        request = requests_made[0]
+        self.assertEquals(request.url, "http://fakehost/live/timeseries/new/")
+        self.assertEquals(request.method, "POST")
+        self.assertIn(b"sensor=3", request.body)
+
+    def test_update_sensor_values(self):
+        self.client.update_sensor_values(1, [(3, 2.0), (4, True)])
+        requests_made = self.client._async_http_service.requests
+        self.assertEquals(len(requests_made), 2)
+        self.assertTrue(requests_made[0].body.startswith(
+            b"recipe_instance=1&sensor=3&"))
+        self.assertTrue(requests_made[1].body.startswith(
+            b"recipe_instance=1&sensor=4&"))
+        self.assertIn(b"value=1.0", requests_made[1].body)
+        # Both samples were taken at the same time.
+        times = [parse_qs(request.body.decode())["time"]
+                 for request in requests_made]
+        self.assertEquals(times[0], times[1])
+
+    def test_update_sensor_values_backing_off(self):
+        self.client._async_http_service.error = RuntimeError("Failed.")
+        self.client.update_sensor_value(1, 2.0, 3)
+        self.client.update_sensor_values(1, [(3, 2.0), (4, True)])
+        self.assertEquals(len(self.client._async_http_service.requests), 1)
+
+    def test_update_sensor_samples_keeps_time(self):
+        sample_time = "2017-01-01T00:00:00.000000+00:00"
+        self.client.update_sensor_samples(
+            [[sample_time, 1, 2.0, 3], [sample_time, 2, 4.0, 5]])
+        requests_made = self.client._async_http_service.requests
+        self.assertEquals(len(requests_made), 2)
+        for request, sensor in zip(requests_made, ("3", "5")):
+            body = parse_qs(request.body.decode())
+            self.assertEquals(body["time"], [sample_time])
+            self.assertEquals(body["sensor"], [sensor])
+
+    def test_update_sensor_value_body(self):
+        sample_time = "2017-01-01T00:00:00.000000+00:00"
+        self.client._post_sensor_value(1, True, 3, sample_time)
+        request, = self.client._async_http_service.requests
+        self.assertEquals(parse_qs(request.body.decode()),
+                          {"recipe_instance": ["1"], "sensor": ["3"],
+                           "time": [sample_time], "value": ["1.0"]})
+
+    def test_update_sensor_samples_backing_off(self):
+        self.client._async_http_service.error = RuntimeError("Failed.")
+        self.client.update_sensor_value(1, 2.0, 3)
+        self.client.update_sensor_samples(
+            [["2017-01-01T00:00:00.000000+00:00", 1, 2.0, 3]])
+        self.assertEquals(len(self.client._async_http_service.requests), 1)
+
+    def test_update_sensor_value_backs_off_after_failure(self):
+        self.client._async_http_service.error = RuntimeError("Failed.")
+        self.client.update_sensor_value(1, 2.0, 3)
+        self.client.update_sensor_value(1, 2.0, 3)
+        self.assertEquals(len(self.client._async_http_service.requests), 1)
+        self.assertEquals(self.client._update_backoff,
+                          2.0 * JouliaHTTPClient.MIN_UPDATE_BACKOFF)
+
+    def test_update_sensor_value_backoff_jittered(self):
+        self.client._async_http_service.error = RuntimeError("Failed.")
+        before = time.monotonic()
+        self.client.update_sensor_value(1, 2.0, 3)
+        wait = self.client._next_update_time - before
+        self.assertGreaterEqual(wait, 0.5 * JouliaHTTPClient.MIN_UPDATE_BACKOFF)
+        self.assertLessEqual(wait, JouliaHTTPClient.MIN_UPDATE_BACKOFF + 1.0)
+
+    def test_update_sensor_value_backoff_capped(self):
+        self.client._async_http_service.error = RuntimeError("Failed.")
+        for _ in range(10):
+            self.client._next_update_time = 0.0
+            self.client.update_sensor_value(1, 2.0, 3)
+        self.assertEquals(self.client._update_backoff,
+                          JouliaHTTPClient.MAX_UPDATE_BACKOFF)
+
+    def test_update_sensor_value_backoff_reset_on_success(self):
+        self.client._async_http_service.error = RuntimeError("Failed.")
+        self.client.update_sensor_value(1, 2.0, 3)
+        self.client._async_http_service.error = False
+        self.client._next_update_time = 0.0
+        self.client.update_sensor_value(1, 2.0, 3)
+        self.assertEquals(len(self.client._async_http_service.requests), 2)
+        self.assertEquals(self.client._update_backoff,
+                          JouliaHTTPClient.MIN_UPDATE_BACKOFF)
+
+    def test_update_sensor_value_reuses_fixed_fields(self):
+        self.client.update_sensor_value(1, 2.0, 3)
+        self.client.update_sensor_value(1, 4.0, 3)
+        first, second = self.client._async_http_service.requests
+        for request, value in ((first, b"value=2.0"), (second, b"value=4.0")):
+            self.assertTrue(
+                request.body.startswith(b"recipe_instance=1&sensor=3&time="))
+            self.assertIn(value, request.body)
 
     def test_get_mash_points(self):
         self.client._requests_service.response_map[
@@ -257,18 +441,151 @@ class TestJouliaWebsocketClient(unittest.TestCase):
         value = 2
         sensor = 3
         self.client.update_sensor_value(recipe_instance, value, sensor)
+        self.assertEquals(self.client.websocket.written_messages, [])
+        self.client.flush_sensor_values()
 
         date_regexp = r'\d{4}[-/]\d{2}[-/]\d{2}'
         time_regexp = r'\d{2}:\d{2}:\d{2}.\d{6}\+\d{2}:\d{2}'
         datetime_regexp = "{}T{}".format(date_regexp, time_regexp)
 
-        got = self.client.websocket.written_messages[0]
-        parsed = json.loads(got)
+        self.assertEquals(len(self.client.websocket.written_messages), 1)
+        parsed = json.loads(self.client.websocket.written_messages[0])
+        self.assertEquals(set(parsed),
+                          {'time', 'recipe_instance', 'value', 'sensor'})
         self.assertRegexpMatches(parsed['time'], datetime_regexp)
         self.assertEquals(parsed['recipe_instance'], recipe_instance)
         self.assertEquals(parsed['value'], 2)
         self.assertEquals(parsed['sensor'], 3)
 
+    def test_update_sensor_value_flushed_by_ioloop(self):
+        self.client.update_sensor_value(1, 2, 3)
+        self.client.update_sensor_value(1, 4, 5)
+
+        @gen.coroutine
+        def next_iteration():
+            yield gen.moment
+        IOLoop.current().run_sync(next_iteration)
+
+        got = [json.loads(message)
+               for message in self.client.websocket.written_messages]
+        self.assertEquals([(sample['value'], sample['sensor'])
+                           for sample in got], [(2, 3), (4, 5)])
+        # Both samples were queued in the same IOLoop iteration.
+        self.assertEquals(got[0]['time'], got[1]['time'])
+
+    def test_update_sensor_value_latest_value_wins(self):
+        self.client.update_sensor_value(1, 2, 3)
+        self.client.update_sensor_value(1, 4, 5)
+        self.client.update_sensor_value(1, 6, 3)
+        self.client.flush_sensor_values()
+
+        got = [json.loads(message)
+               for message in self.client.websocket.written_messages]
+        self.assertEquals([(sample['value'], sample['sensor'])
+                           for sample in got], [(6, 3), (4, 5)])
+
+    def test_update_sensor_value_flushes_when_full(self):
+        for sensor in range(JouliaWebsocketClient.MAX_PENDING_SAMPLES):
+            self.client.update_sensor_value(1, 2, sensor)
+
+        self.assertEquals(len(self.client.websocket.written_messages),
+                          JouliaWebsocketClient.MAX_PENDING_SAMPLES)
+
+    def test_update_sensor_values_flushes_when_full(self):
+        values = [(sensor, 2) for sensor in
+                  range(JouliaWebsocketClient.MAX_PENDING_SAMPLES + 1)]
+        self.client.update_sensor_values(1, values)
+
+        self.assertEquals(len(self.client.websocket.written_messages),
+                          JouliaWebsocketClient.MAX_PENDING_SAMPLES + 1)
+
+    def test_update_sensor_values_includes_queued_samples(self):
+        self.client.update_sensor_value(1, 2, 3)
+        self.client.update_sensor_values(1, [(4, 5)])
+        self.client.flush_sensor_values()
+
+        got = [json.loads(message)
+               for message in self.client.websocket.written_messages]
+        self.assertEquals([(sample['value'], sample['sensor'])
+                           for sample in got], [(2, 3), (5, 4)])
+        # Both were queued in the same IOLoop iteration.
+        self.assertEquals(got[0]['time'], got[1]['time'])
+
+    def test_update_sensor_values_message_per_sample(self):
+        recipe_instance = 1
+        self.client.update_sensor_values(recipe_instance, [(3, 2), (4, True)])
+        self.client.flush_sensor_values()
+
+        got = [json.loads(message)
+               for message in self.client.websocket.written_messages]
+        self.assertEquals(len(got), 2)
+        for sample in got:
+            self.assertEquals(set(sample),
+                              {'time', 'recipe_instance', 'value', 'sensor'})
+            self.assertEquals(sample['recipe_instance'], recipe_instance)
+        self.assertEquals([(sample['value'], sample['sensor'])
+                           for sample in got], [(2, 3), (1, 4)])
+        # All of the samples were taken at the same time.
+        self.assertEquals(got[0]['time'], got[1]['time'])
+
+    def test_flush_sensor_values_websocket_closed(self):
+        def closed_write_message(message):
+            raise WebSocketClosedError()
+        self.client.websocket.write_message = closed_write_message
+
+        self.client.update_sensor_values(1, [(3, 2), (4, True)])
+        self.client.flush_sensor_values()
+
+        got = self.http_client.update_sensor_value_posts
+        want = [{"recipe_instance": 1, "value": 2, "sensor": 3},
+                {"recipe_instance": 1, "value": 1, "sensor": 4}]
+        self.assertEquals(got, want)
+
+    def test_flush_sensor_values_websocket_closed_part_way(self):
+        written_messages = self.client.websocket.written_messages
+
+        def closing_write_message(message):
+            if written_messages:
+                raise WebSocketClosedError()
+            written_messages.append(message)
+        self.client.websocket.write_message = closing_write_message
+
+        self.client.update_sensor_values(1, [(3, 2), (4, True), (5, 6)])
+        self.client.flush_sensor_values()
+
+        self.assertEquals(json.loads(written_messages[0])['sensor'], 3)
+        got = self.http_client.update_sensor_value_posts
+        want = [{"recipe_instance": 1, "value": 1, "sensor": 4},
+                {"recipe_instance": 1, "value": 6, "sensor": 5}]
+        self.assertEquals(got, want)
+
+    def test_update_sensor_values_empty(self):
+        self.client.update_sensor_values(1, [])
+        self.client.flush_sensor_values()
+        self.assertEquals(self.client.websocket.written_messages, [])
+
+    def test_update_sensor_values_empty_iterator_schedules_nothing(self):
+        with patch.object(IOLoop.current(), 'add_callback') as add_callback:
+            self.client.update_sensor_values(1, zip([], []))
+        add_callback.assert_not_called()
+        self.assertEquals(len(self.client._pending_samples), 0)
+
+    def test_update_sensor_values_flushed_by_ioloop(self):
+        self.client.update_sensor_values(1, [(3, 2)])
+        self.client.update_sensor_values(2, [(4, 5)])
+        self.assertEquals(self.client.websocket.written_messages, [])
+
+        @gen.coroutine
+        def next_iteration():
+            yield gen.moment
+        IOLoop.current().run_sync(next_iteration)
+
+        got = [json.loads(message)
+               for message in self.client.websocket.written_messages]
+        self.assertEquals([(sample['recipe_instance'], sample['value'],
+                            sample['sensor']) for sample in got],
+                          [(1, 2, 3), (2, 5, 4)])
+
     def test_identify(self):
         self.client.http_client.identifier = 11
         sensor_name = "fake_sensor"
@@ -309,6 +626,24 @@ class TestJouliaWebsocketClient(unittest.TestCase):
             recipe_instance=recipe_instance, sensor=sensor)
         self.assertEquals(self.client._subscriptions, {subscription})
 
+    def test_subscribe_while_reconnecting(self):
+        self.client._reconnecting = Future()
+
+        self.client.subscribe(1, 3)
+
+        self.assertEquals(self.client.websocket.written_messages, [])
+        subscription = JouliaWebsocketClient.Subscription(
+            recipe_instance=1, sensor=3)
+        self.assertEquals(self.client._subscriptions, {subscription})
+
+    def test_subscribe_reuses_message(self):
+        self.client.subscribe(1, 3, history_time=0)
+        self.client.subscribe(1, 3, history_time=0)
+
+        self.check_subscription(0, 1, 3, history_time=0)
+        got = self.client.websocket.written_messages
+        self.assertIs(got[0], got[1])
+
     def test_register_callback(self):
         def foo(_):
             pass  # pragma: no cover
@@ -318,16 +653,16 @@ class TestJouliaWebsocketClient(unittest.TestCase):
         self.assertIn(foo, self.client.callbacks)
 
     def test_on_message_callback(self):
-        counters = {"foo": 0}
+        received = []
 
         def foo(response):
-            counters["foo"] += 1
+            received.append(response)
 
         self.client.register_callback(foo)
 
-        self.client.on_message("")
+        self.client.on_message('{"headers":[],"data":[]}')
 
-        self.assertEquals(counters['foo'], 1)
+        self.assertEquals(received, [{"headers": [], "data": []}])
 
     def test_on_message_closed_connection(self):
         # Make a subscription first.
@@ -348,6 +683,7 @@ class TestJouliaWebsocketClient(unittest.TestCase):
 
         # Close the connection.
         self.client.on_message(None)
+        IOLoop.current().run_sync(lambda: self.client._reconnecting)
 
         # No callbacks should be called on closed connection.
         self.assertEquals(counters['foo'], 0)
@@ -361,3 +697,33 @@ class TestJouliaWebsocketClient(unittest.TestCase):
         history_time = 0
         self.check_subscription(resubscribe_index, recipe_instance, sensor,
                                 history_time)
+
+    def test_connect_requests_compression(self):
+        got = {}
+
+        def recording_websocket_connect(url, **kwargs):
+            got.update(kwargs)
+            return stub_websocket_connect(url, **kwargs)
+        self.client._websocket_connect = recording_websocket_connect
+
+        IOLoop.current().run_sync(self.client._connect)
+
+        self.assertEquals(got["compression_options"], {})
+
+    def test_on_message_closed_connection_retries(self):
+        self.client.MIN_RECONNECT_BACKOFF = 0.0
+        original_socket = self.client.websocket
+        attempts = {"count": 0}
+
+        def flaky_websocket_connect(url, **kwargs):
+            attempts["count"] += 1
+            if attempts["count"] == 1:
+                raise IOError("Connection refused.")
+            return stub_websocket_connect(url, **kwargs)
+        self.client._websocket_connect = flaky_websocket_connect
+
+        self.client.on_message(None)
+        IOLoop.current().run_sync(lambda: self.client._reconnecting)
+
+        self.assertEquals(attempts["count"], 2)
+        self.assertIsNot(original_socket, self.client.websocket)
@@ -0,0 +1,36 @@
+"""JSON serialization for messages exchanged with joulia-webserver.
+
+Uses orjson when it is available, which is considerably faster than the
+standard library for the small messages streamed over the websocket, and falls
+back to the standard library json module otherwise.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # pylint: disable=invalid-name
+
+
+if orjson is not None:  # pragma: no cover
+    def dumps(obj):
+        """Serializes ``obj`` to a JSON formatted str."""
+        return orjson.dumps(
+            obj, option=orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+
+    loads = orjson.loads  # pylint: disable=invalid-name
+else:
+    def dumps(obj):
+        """Serializes ``obj`` to a JSON formatted str, without the whitespace
+        json adds after separators by default.
+        """
+        return json.dumps(obj, separators=(',', ':'))
+
+    def loads(data):
+        """Deserializes a JSON formatted str or UTF-8 encoded bytes, such as
+        an HTTP response body, which json only accepts from Python 3.6.
+        """
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return json.loads(data)
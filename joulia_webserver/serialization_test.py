@@ -0,0 +1,34 @@
+"""Tests for joulia_webserver.serialization module."""
+
+import json
+import unittest
+
+import numpy as np
+
+from joulia_webserver import serialization
+
+
+class TestSerialization(unittest.TestCase):
+    """Tests dumps and loads."""
+
+    def test_dumps_returns_str(self):
+        got = serialization.dumps({"sensor": 1, "value": 2.5})
+        self.assertIsInstance(got, str)
+        self.assertEqual(json.loads(got), {"sensor": 1, "value": 2.5})
+
+    def test_dumps_compact(self):
+        got = serialization.dumps({"headers": ["sensor", "value"],
+                                   "data": [[1, 2.5], [2, 3.5]]})
+        self.assertNotIn(" ", got)
+
+    def test_dumps_numpy_float(self):
+        got = serialization.dumps({"value": np.float64(2.5)})
+        self.assertEqual(json.loads(got), {"value": 2.5})
+
+    def test_loads(self):
+        got = serialization.loads('{"sensor":1,"value":true}')
+        self.assertEqual(got, {"sensor": 1, "value": True})
+
+    def test_loads_bytes(self):
+        got = serialization.loads(b'{"sensor":1,"value":true}')
+        self.assertEqual(got, {"sensor": 1, "value": True})
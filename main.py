@@ -11,6 +11,7 @@ from tornado import ioloop
 from brewery.system import System
 from measurement.analog_reader import MCP3004AnalogReader
 import settings
+from utils import install_event_loop
 
 logging.config.dictConfig(settings.LOGGING_CONFIG)
 LOGGER = logging.getLogger(__name__)
@@ -25,6 +26,8 @@ def main():
                 root_directory)
     os.chdir(root_directory)
 
+    install_event_loop()
+
     analog_reader = create_analog_reader()
     gpio.setmode(gpio.BCM)
 
@@ -10,6 +10,7 @@ import settings
 from testing.stub_gpio import StubGPIO
 from testing.stub_mcp3008 import StubSpiDev as StubSpiDev
 from testing.stub_mcp3008 import StubMCP3008 as StubMCP3008
+from utils import install_event_loop
 
 logging.config.dictConfig(settings.LOGGING_CONFIG)
 LOGGER = logging.getLogger(__name__)
@@ -24,6 +25,8 @@ def main():
                 root_directory)
     os.chdir(root_directory)
 
+    install_event_loop()
+
     analog_reader = create_analog_reader()
     gpio = StubGPIO()
     gpio.setmode(gpio.BCM)
@@ -17,6 +17,8 @@ class Updater(object):
         auth_token: The authentication token associate with the
             continuous_integration group on joulia-webserver.
         joulia_host: The host name with protocol prefix to send requests to.
+        session: The requests Session sending requests, which keeps the
+            connection alive across the POSTs for each of the states.
     """
     RELEASE_ENDPOINT = '/brewery/api/joulia_controller_release/'
     STATE_ENDPOINT = '/brewery/api/brewing_state/'
@@ -24,6 +26,7 @@ class Updater(object):
     def __init__(self, auth_token, joulia_host):
         self.auth_token = auth_token
         self.joulia_host = joulia_host
+        self.session = requests.Session()
 
     @property
     def _authentication_headers(self):
@@ -42,7 +45,7 @@ class Updater(object):
             The primary key of the newly created update.
         """
         data = {'commit_hash': commit_hash}
-        response = requests.post(
+        response = self.session.post(
             '{}{}'.format(self.joulia_host, self.RELEASE_ENDPOINT), data=data,
             headers=self._authentication_headers)
         response.raise_for_status()
@@ -66,7 +69,7 @@ class Updater(object):
                 'name': state.NAME,
                 'description': state.DESCRIPTION,
             }
-            response = requests.post(
+            response = self.session.post(
                 '{}{}'.format(self.joulia_host, self.STATE_ENDPOINT),
                 data=data,
                 headers=self._authentication_headers)
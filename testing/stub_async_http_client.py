@@ -28,8 +28,11 @@ class StubAsyncHTTPClient(AsyncHTTPClient):  # pylint: disable=abstract-method
         self.responses = []
         self._response_count = 0
 
+        self.requests = []
+
     def fetch(self, request, callback=None, raise_error=True, **kwargs):
-        del request, raise_error, kwargs
+        del raise_error, kwargs
+        self.requests.append(request)
         # If a list of multiple responses has not been provided, fall back onto
         # the single response.
         if not self.responses:
@@ -38,6 +38,14 @@ class StubJouliaHTTPClient(JouliaHTTPClient):
         self.update_sensor_value_posts.append(update)
         return
 
+    def update_sensor_values(self, recipe_instance, values):
+        for sensor, value in values:
+            self.update_sensor_value(recipe_instance, value, sensor)
+
+    def update_sensor_samples(self, samples):
+        for _, recipe_instance, value, sensor in samples:
+            self.update_sensor_value(recipe_instance, value, sensor)
+
     def get_mash_points(self, recipe_pk):
         del recipe_pk
         return self.mash_points
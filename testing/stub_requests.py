@@ -8,7 +8,8 @@ class StubRequests(object):
     """Stub requests service for mocking requests to a server without actually
     committing them. Responds to any requests with the entry for the request URL
     in response_map. If the URL is not in the response map, responds with
-    response_string.
+    response_string. The keyword arguments of the last request are kept in
+    last_kwargs.
     """
     def __init__(self):
         self.response_string = None
@@ -16,13 +17,15 @@ class StubRequests(object):
         self.server_there = True
         self.status_code = 200
         self.reason = "OK"
+        self.last_kwargs = None
 
     def response(self, url):
         """Gets the response stored for the given url."""
         return self.response_map.get(url, self.response_string)
 
     def _stub_request(self, url, headers, *args, **kwargs):
-        del headers, args, kwargs
+        del headers, args
+        self.last_kwargs = kwargs
         if not self.server_there:
             raise requests.exceptions.ConnectionError()
         return StubResponse(self.response(url), self.status_code, self.reason)
@@ -52,6 +55,10 @@ class StubResponse(requests.Response):
         self.response_string = response_string
         self.status_code = status_code
         self.reason = reason
+        if response_string is not None:
+            self._content = response_string.encode('utf-8')
+        else:
+            self._content = b''
 
     def json(self, **kwargs):
         del kwargs
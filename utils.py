@@ -4,6 +4,7 @@ accepting of data with and from a ``joulia-webserver`` instance.
 """
 import functools
 import logging
+import operator
 
 import gpiocrust
 
@@ -21,14 +22,14 @@ def rsetattr(obj, attr, val):
         attr: The attribute path with dunderscores separating attribute paths
         val: value to set
     """
-    pre, _, post = attr.rpartition('__')
+    leaf_getter, post = _split_leaf_attribute(attr)
 
-    leaf_obj = rgetattr(obj, pre) if pre else obj
+    leaf_obj = leaf_getter(obj) if leaf_getter is not None else obj
 
     if not hasattr(leaf_obj, post):
         raise AttributeError(
             "{}.{} has no attribute {} on it, and rsetattr does not initialize"
-            "values.".format(obj, pre, post))
+            "values.".format(obj, attr.rpartition('__')[0], post))
 
     return setattr(leaf_obj, post, val)
 
@@ -45,7 +46,26 @@ def rgetattr(obj, attr):
 
     Returns: value at the attribute
     """
-    return functools.reduce(getattr, [obj] + attr.split('__'))
+    return _attribute_getter(attr)(obj)
+
+
+@functools.lru_cache(maxsize=None)
+def _attribute_getter(attr):
+    """Compiles a dunderscore separated attribute path into a getter, which
+    walks the path in C. Cached, since the same few paths are looked up
+    repeatedly.
+    """
+    return operator.attrgetter(attr.replace('__', '.'))
+
+
+@functools.lru_cache(maxsize=None)
+def _split_leaf_attribute(attr):
+    """Splits a dunderscore separated attribute path into a getter for the
+    object holding the final attribute and the final attribute's name. The
+    getter is None if the path is a single attribute.
+    """
+    pre, _, post = attr.rpartition('__')
+    return (_attribute_getter(pre) if pre else None), post
 
 
 def exists_and_not_none(obj, key):
@@ -55,17 +75,45 @@ def exists_and_not_none(obj, key):
     return key in obj and obj[key] is not None
 
 
+LITERS_PER_GALLON = 3.79  # L/gal
+DENSITY_WATER = 1000.0  # grams/L
+SPECIFIC_HEAT_WATER = 4.184  # J/(degC * grams)
+
+# Heat capacity of a gallon of water in J/(degF * gal). Computed once, since it
+# only depends on physical constants.
+SPECIFIC_HEAT_WATER_PER_GALLON_FAHRENHEIT = (
+    LITERS_PER_GALLON * DENSITY_WATER * SPECIFIC_HEAT_WATER * (5.0 / 9.0))
+# Reciprocal of the above in (degF * gal)/J, so conversions multiply by it.
+_POWER_TO_TEMPERATURE_RATE_FACTOR = (
+    1.0 / SPECIFIC_HEAT_WATER_PER_GALLON_FAHRENHEIT)
+
+
 def power_to_temperature_rate(power, volume):
     """Converts power (in Watts) and volume of water (in gallons) into
     temperature change rate (in degF/second).
     """
-    volume *= 3.79  # L
-    density_water = 1000.0  # grams/L
-    mass = volume * density_water  # grams
-    specific_heat_water = 4.184  # J/(degC * grams)
-    specific_heat = mass * specific_heat_water  # J/degC
-    specific_heat_fahrenheit = specific_heat * (5.0 / 9.0)  # J/degF
-    return power / specific_heat_fahrenheit  # degF/second
+    return power * _POWER_TO_TEMPERATURE_RATE_FACTOR / volume  # degF/second
 
 
-GPIO_MOCK_API_ACTIVE = 'gpio_mock' in dir(gpiocrust)
+GPIO_MOCK_API_ACTIVE = hasattr(gpiocrust, 'gpio_mock')
+
+
+def install_event_loop():
+    """Runs tornado's IOLoop on asyncio using uvloop's event loop, which is
+    considerably faster at the socket handling the websocket and HTTP clients
+    do. Leaves the default IOLoop in place if uvloop is not installed. Must be
+    called before the IOLoop is first used.
+    """
+    try:
+        import uvloop
+    except ImportError:
+        LOGGER.info("uvloop is not installed. Using the default IOLoop.")
+        return
+    # Only needed when uvloop is installed, so they aren't imported along with
+    # the rest of utils.
+    import asyncio
+    from tornado.platform.asyncio import AsyncIOMainLoop
+
+    LOGGER.info("Running the IOLoop on uvloop.")
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    AsyncIOMainLoop().install()
@@ -76,8 +76,7 @@ class TestRgetattr(unittest.TestCase):
 
         foo = Foo()
 
-        rgetattr(foo, "foo_var")
-        got = foo.foo_var
+        got = rgetattr(foo, "foo_var")
         self.assertEquals(got, 11)
 
     def test_get_on_related(self):
@@ -91,8 +90,7 @@ class TestRgetattr(unittest.TestCase):
 
         bar = Bar()
 
-        rgetattr(bar, "bar_var__foo_var")
-        got = bar.bar_var.foo_var
+        got = rgetattr(bar, "bar_var__foo_var")
         self.assertEquals(got, 11)
 
     def test_get_on_nested_related(self):
@@ -110,8 +108,7 @@ class TestRgetattr(unittest.TestCase):
 
         baz = Baz()
 
-        rgetattr(baz, "baz_var__bar_var__foo_var")
-        got = baz.baz_var.bar_var.foo_var
+        got = rgetattr(baz, "baz_var__bar_var__foo_var")
         self.assertEquals(got, 11)
 
     def test_get_doesnt_exist(self):
@@ -123,6 +120,18 @@ class TestRgetattr(unittest.TestCase):
         with self.assertRaises(AttributeError):
             rgetattr(foo, "bar_var")
 
+    def test_get_same_path_on_different_objects(self):
+        class Foo(object):
+            def __init__(self, foo_var):
+                self.foo_var = foo_var
+
+        class Bar(object):
+            def __init__(self, foo_var):
+                self.bar_var = Foo(foo_var)
+
+        self.assertEquals(rgetattr(Bar(11), "bar_var__foo_var"), 11)
+        self.assertEquals(rgetattr(Bar(12), "bar_var__foo_var"), 12)
+
 
 class TestExistsAndNotNone(unittest.TestCase):
     """Tests for exists_and_not_none."""
@@ -148,4 +157,12 @@ class TestPowerToTemperatureRate(unittest.TestCase):
         volume = 1.0  # Gallons
         got = power_to_temperature_rate(power, volume)
         want = 0.0113  # degF/second
-        self.assertAlmostEquals(got, want, 2)
\ No newline at end of file
+        self.assertAlmostEquals(got, want, 2)
+
+    def test_matches_expanded_calculation(self):
+        for power, volume in ((100.0, 1.0), (5500.0, 7.5), (-250.0, 0.5)):
+            mass = volume * 3.79 * 1000.0  # grams
+            specific_heat_fahrenheit = mass * 4.184 * (5.0 / 9.0)  # J/degF
+            want = power / specific_heat_fahrenheit
+            got = power_to_temperature_rate(power, volume)
+            self.assertAlmostEqual(got, want, 12)
\ No newline at end of file
@@ -1,14 +1,11 @@
-import json
+from collections import namedtuple
+import itertools
 import logging
-from weakref import WeakKeyDictionary
-from weakref import WeakSet
+import operator
 
-import requests
 from tornado import ioloop
 
 from joulia_webserver.client import JouliaWebsocketClient
-from utils import exists_and_not_none
-from utils import rgetattr
 
 LOGGER = logging.getLogger(__name__)
 
@@ -17,6 +14,38 @@ VALUE_VARIABLE_TYPE = 'value'
 OVERRIDE_VARIABLE_TYPE = 'override'
 
 
+class _InstanceState(object):
+    """The state a ManagedVariable keeps for each instance registered with
+    it, gathered together so it takes a single lookup to retrieve.
+
+    Attributes:
+        client: The instance's client for communicating with the server.
+        recipe_instance: The recipe_instance id from the server for the current
+            recipe execution.
+        authtoken: The instance's authorization token.
+        callback: A callback to be called when a related frame is received
+            from the server.
+        ids: A dictionary mapping the variable type (e.g. 'value' or
+            'override') to the sensor's identifier on the server.
+        value_id: The sensor's identifier on the server for the 'value'
+            variable type, which is sent with every streamed update, so is
+            kept outside of ``ids`` to skip a lookup. None until identified.
+        overridden: Whether the user interface has overridden the value, so
+            the controls should not set it.
+    """
+    __slots__ = ('client', 'recipe_instance', 'authtoken', 'callback', 'ids',
+                 'value_id', 'overridden')
+
+    def __init__(self, client, recipe_instance, authtoken, callback):
+        self.client = client
+        self.recipe_instance = recipe_instance
+        self.authtoken = authtoken
+        self.callback = callback
+        self.ids = {}
+        self.value_id = None
+        self.overridden = False
+
+
 class ManagedVariable(object):
     """Top level class to represent a managed variable that controls how
     the property is get or set for a given object.
@@ -28,38 +57,33 @@ class ManagedVariable(object):
         default: Value to use for get's before any other process has set it
         sensor_name: The name of the sensor to use for handshakes with the
             server.
-        clients: A dictionary that maps an object to it's instances client for
-            communicating with the server.
-        data: A dictionary that maps an object to its instance's value. This
-            is necessary, because this variable needs to be assigned at the
-            class level in order for get/set to work correctly.
-        ids: A dictionary that maps an object to its identifier on the server.
-        variable_types: A dictionary mapping a sensor id to the variable type.
-        authtokens: A dictionary that maps an object to its instance's
-            authorization token.
-        callbacks: A callback to be called when a related frame is received
-            from the server.
-        registered: A set of the instances of the class containing the instance
-            of the ManagedVariable that have registered.
-        registered: A set of the instances of the class containing the instance
-            of the ManagedVariable that have subscribed.
+        data_key: The key the instance's value is stored under in the
+            instance's ``__dict__``. Values live on the instance, rather than
+            in a weak dictionary on this class-level variable, so reads and
+            writes are a single plain dict lookup. Classes using managed
+            variables therefore need a ``__dict__`` (i.e. no ``__slots__``
+            without ``'__dict__'``).
+        state_key: The key each registered instance's ``_InstanceState`` is
+            stored under in the instance's ``__dict__``. Stored on the
+            instance, like its value, rather than in a weak dictionary on this
+            variable, so looking it up on every update does not create a weak
+            reference, and it is released along with the instance.
     """
+    # Managed variables have a fixed set of attributes, so slots keep them
+    # small and quick to access.
+    __slots__ = ('default', 'sensor_name', 'data_key', 'state_key')
+
+    # Numbers each variable created, so variables sharing a sensor name still
+    # store their values and states under different keys.
+    _key_ids = itertools.count()
 
     def __init__(self, sensor_name, default=None):
         self.default = default
         self.sensor_name = sensor_name
 
-        self.clients = WeakKeyDictionary()
-        self.recipe_instances = WeakKeyDictionary()
-        self.data = WeakKeyDictionary()
-        self.ids = {}
-        self.variable_types = {}
-        self.authtokens = WeakKeyDictionary()
-        self.callbacks = WeakKeyDictionary()
-        self.registered = WeakSet()
-
-        # External APIs exposed for mocking and replacing
-        self._requests_service = requests
+        key_id = next(ManagedVariable._key_ids)
+        self.data_key = '_managed_{}:{}'.format(sensor_name, key_id)
+        self.state_key = '_managed_state_{}:{}'.format(sensor_name, key_id)
 
     def __get__(self, obj, obj_type):
         """Retrieves the current value for the object requested"""
@@ -68,20 +92,26 @@ class ManagedVariable(object):
         if obj is None:
             return self
 
-        # Set the value to the default if it doesn't have a value yet
-        if obj not in self.data:
-            if self.default is None:
-                raise AttributeError(
-                    "Variable {} attempted to be accessed on {} prior to"
-                    " initialization and no default was set."
-                    "".format(self.sensor_name, obj))
-            self.data[obj] = self.default
+        try:
+            return obj.__dict__[self.data_key]
+        except KeyError:
+            pass
 
-        return self.data.get(obj)
+        # Set the value to the default if it doesn't have a value yet. It is
+        # stored, so the default is only checked on the first read, and later
+        # reads return from the lookup above without branching on it.
+        default = self.default
+        if default is None:
+            raise AttributeError(
+                "Variable {} attempted to be accessed on {} prior to"
+                " initialization and no default was set."
+                "".format(self.sensor_name, obj))
+        obj.__dict__[self.data_key] = default
+        return default
 
     def __set__(self, obj, value):
         """Sets the current value for the object requested"""
-        self.data[obj] = value
+        obj.__dict__[self.data_key] = value
 
     def register(self, client, instance, recipe_instance,
                  authtoken=None, callback=None):
@@ -100,15 +130,16 @@ class ManagedVariable(object):
                 retrieved. Useful if additional action should be taken
                 to validate the servers's feedback.
         """
-        self.clients[instance] = client
-
-        self.recipe_instances[instance] = recipe_instance
-        self.authtokens[instance] = authtoken
-        self.callbacks[instance] = callback
+        instance.__dict__[self.state_key] = _InstanceState(
+            client, recipe_instance, authtoken, callback)
 
         self.identify(instance, recipe_instance)
 
-        self.registered.add(instance)
+    def get_state(self, instance):
+        """Gets the ``_InstanceState`` stored when ``instance`` was
+        registered.
+        """
+        return instance.__dict__[self.state_key]
 
     def identify(self, instance, recipe_instance,
                  variable_type=VALUE_VARIABLE_TYPE):
@@ -121,13 +152,14 @@ class ManagedVariable(object):
             variable_type: The type of variable to subscribe to (e.g. 'value' or
                 'override'). Defaults to 'value'.
         """
-        client = self.clients[instance]
-        id_sensor = client.identify(
+        state = self.get_state(instance)
+        id_sensor = state.client.identify(
             self.sensor_name, recipe_instance, variable_type)
         LOGGER.info("Identified sensor %s in recipe_instance %s as id %s.",
                     self.sensor_name, recipe_instance, id_sensor)
-        self.ids[(instance, variable_type)] = id_sensor
-        self.variable_types[id_sensor] = variable_type
+        state.ids[variable_type] = id_sensor
+        if variable_type == VALUE_VARIABLE_TYPE:
+            state.value_id = id_sensor
 
 
 class WebsocketVariable(ManagedVariable):
@@ -137,10 +169,7 @@ class WebsocketVariable(ManagedVariable):
         websocket: A class-level websocket connection with the server used
             for exchanging data to/from the server.
     """
-
-    def __init__(self, sensor_name, default=None):
-        super(WebsocketVariable, self).__init__(sensor_name, default=default)
-        self.callback = WeakKeyDictionary()
+    __slots__ = ()
 
     def register(self, client, instance, recipe_instance,
                  authtoken=None, callback=None):
@@ -155,6 +184,7 @@ class StreamingVariable(WebsocketVariable):
     """A version of `ManagedVaraiable` that publishes to a sensor stream
     on the server.
     """
+    __slots__ = ()
 
     def __set__(self, instance, value):
         """Sets the value to the current instance and sends the new value
@@ -164,18 +194,29 @@ class StreamingVariable(WebsocketVariable):
             instance: The instance to set the value for
             value: The value to set
         """
-        super(StreamingVariable, self).__set__(instance, value)
-        client = self.clients[instance]
-        recipe_instance = self.recipe_instances[instance]
-        sensor = self.ids[(instance, VALUE_VARIABLE_TYPE)]
-        LOGGER.debug("Sending new value for %s: %s.", self.sensor_name, value)
-        client.update_sensor_value(recipe_instance, value, sensor)
+        # Stored directly, rather than through ManagedVariable.__set__, to save
+        # a call on every update.
+        data = instance.__dict__
+        data[self.data_key] = value
+        state = data[self.state_key]
+        sensor = state.value_id
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug("Sending new value for %s: %s.", self.sensor_name,
+                         value)
+        state.client.update_sensor_value(state.recipe_instance, value, sensor)
 
 
 class SubscribableVariable(WebsocketVariable):
     """A version of `ManagedVariable` that subscribes to a sensor stream
     on the server, and uses the values received to set the property.
     """
+    __slots__ = ('subscribers',)
+
+    # A subscription made by an instance, with the handler that applies the
+    # values received for it. A tuple, so it is unpacked in one step for every
+    # message received.
+    Subscriber = namedtuple(
+        'Subscriber', ('instance', 'variable_type', 'handler'))
 
     def __init__(self, sensor_name, default=None):
         super(SubscribableVariable, self).__init__(sensor_name, default=default)
@@ -203,85 +244,146 @@ class SubscribableVariable(WebsocketVariable):
         """
         # If we don't have a subscription setup yet, send a subscribe
         # request through the websocket
-        sensor_key = (instance, variable_type)
-        if sensor_key not in self.ids:
+        state = self.get_state(instance)
+        if variable_type not in state.ids:
             self.identify(instance, recipe_instance, variable_type)
-        sensor = self.ids[sensor_key]
-        subscription_key = (sensor, variable_type, recipe_instance)
+        sensor = state.ids[variable_type]
+        # Checked here rather than in _subscriber_key, which is on the receive
+        # path, since ids outside of 32 bits would silently collide with other
+        # keys.
+        if not (0 <= sensor < 2**32 and 0 <= recipe_instance < 2**32):
+            raise ValueError(
+                "Sensor id {} and recipe instance id {} must both be in "
+                "[0, 2**32) to subscribe.".format(sensor, recipe_instance))
+        subscription_key = self._subscriber_key(sensor, recipe_instance)
         if subscription_key not in self.subscribers:
             LOGGER.info('Subscribing to %s (%s:%s), instance %s',
                         sensor, self.sensor_name, variable_type,
                         recipe_instance)
 
-            subscriber = {'instance': instance}
-            self.subscribers[subscription_key] = subscriber
+            subscriber = self.Subscriber(
+                instance=instance, variable_type=variable_type,
+                handler=self._make_handler(instance, variable_type))
+            # Replaced rather than updated in place, so a message handler
+            # iterating over the previous dict never sees it change under it.
+            subscribers = dict(self.subscribers)
+            subscribers[subscription_key] = subscriber
+            self.subscribers = subscribers
 
-            client = self.clients[instance]
-            client.subscribe(recipe_instance, sensor)
+            state.client.subscribe(recipe_instance, sensor)
 
     @staticmethod
-    def deserialize(headers, serialized):
-        assert len(headers) == len(serialized)
-        result = {}
-        for i in range(len(headers)):
-            result[headers[i]] = serialized[i]
-        return result
-
-    def on_message(self, response):
+    def _subscriber_key(sensor, recipe_instance):
+        """Packs the sensor id and recipe instance id of a subscription into a
+        single integer for keying ``subscribers``, which hashes more cheaply
+        than a tuple for every message received. Both ids must be non-negative
+        and fit in 32 bits. The sensor id alone identifies the variable type, so
+        it is not part of the key.
+        """
+        return (sensor << 32) | recipe_instance
+
+    def on_message(self, response_data):
         """A generic callback to handle the response from a websocket
         communication back, which will receive the data and set it
 
         Args:
-            response: The websocket response
+            response_data: The websocket response, already parsed by the
+                client, which shares it with every other callback.
         """
-        response_data = json.loads(response)
         headers = response_data['headers']
+        # Every subscribed variable receives every message, so the fields are
+        # located once per message, rather than deserializing each sample into
+        # a dict.
+        sensor_index = headers.index('sensor')
+        recipe_instance_index = headers.index('recipe_instance')
+        value_index = headers.index('value')
+        try:
+            variable_type_index = headers.index('variable_type')
+        except ValueError:
+            variable_type_index = None
+
+        # Pulls the required fields out of each sample in a single C call.
+        get_fields = operator.itemgetter(
+            sensor_index, recipe_instance_index, value_index)
+
+        subscribers = self.subscribers
+        subscriber_key = self._subscriber_key
+        sample_length = len(headers)
         for serialized in response_data['data']:
-            self._handle_new_data(headers, serialized)
-
-    def _handle_new_data(self, headers, serialized):
-        data = self.deserialize(headers, serialized)
-
-        sensor = data['sensor']
-        variable_type = data.get('variable_type', VALUE_VARIABLE_TYPE)
-        recipe_instance = data['recipe_instance']
-        subscriber_key = (sensor, variable_type, recipe_instance)
-
-        # TODO(willjschmitt): Handle subscribers in client.
-        if subscriber_key not in self.subscribers:
-            return
-
-        response_value = data['value']
+            if len(serialized) != sample_length:
+                raise ValueError(
+                    "Sample {} does not match the headers {}.".format(
+                        serialized, headers))
+            sensor, recipe_instance, response_value = get_fields(serialized)
+
+            # TODO(willjschmitt): Handle subscribers in client.
+            subscriber = subscribers.get(
+                subscriber_key(sensor, recipe_instance))
+            if subscriber is None:
+                continue
+            _, variable_type, handler = subscriber
+            if (variable_type_index is not None
+                    and serialized[variable_type_index] != variable_type):
+                continue
+
+            if LOGGER.isEnabledFor(logging.DEBUG):
+                LOGGER.debug("Received updated value %s for sensor %s(%s),"
+                             " variable_type %s, recipe_instance %s.",
+                             response_value, sensor, self.sensor_name,
+                             variable_type, recipe_instance)
+
+            handler(response_value)
+
+    def _make_handler(self, instance, variable_type):
+        """Builds the function handling new values received for a subscription,
+        so the message handler does not need to branch on the variable type
+        or look up the instance's callback for every message.
 
-        LOGGER.debug("Received updated value %s for sensor %s(%s),"
-                     " variable_type %s, recipe_instance %s.", response_value,
-                     sensor, self.sensor_name, variable_type, recipe_instance)
-
-        subscriber = self.subscribers[subscriber_key]
+        Args:
+            instance: The instance that is subscribing to the stream.
+            variable_type: The type of variable the subscription is for.
 
-        instance = subscriber['instance']
+        Returns:
+            A function accepting the value received from the server.
+        """
+        assert variable_type == VALUE_VARIABLE_TYPE
+        data_key = self.data_key
+        callback = self.get_state(instance).callback
+        default_type = type(self.default) if self.default is not None else None
 
-        if variable_type == VALUE_VARIABLE_TYPE:
+        def handle_value(response_value):
             # Attempts to convert data to the variable type of currently stored
-            # data if it exists. Otherwise, just sets it to the default parsed
-            # type from the json object.
-            if instance in self.data:
-                current_value = self.data[instance]
-                current_type = type(current_value)
-                self.data[instance] = current_type(response_value)
+            # data if it exists, falling back to the type of the default.
+            # Otherwise, just sets it to the default parsed type from the json
+            # object.
+            data = instance.__dict__
+            try:
+                current_value = data[data_key]
+            except KeyError:
+                if default_type is None:
+                    data[data_key] = response_value
+                else:
+                    data[data_key] = default_type(response_value)
             else:
-                self.data[instance] = response_value
-
-            if exists_and_not_none(self.callbacks, instance):
-                callback = self.callbacks[instance]
+                current_type = type(current_value)
+                # JSON values usually already have the stored type, so skip
+                # constructing an identical copy.
+                if type(response_value) is current_type:
+                    data[data_key] = response_value
+                else:
+                    data[data_key] = current_type(response_value)
+
+            if callback is not None:
                 callback(response_value)
 
+        return handle_value
+
 
 class BidirectionalVariable(StreamingVariable, SubscribableVariable):
     """A variable that is bi-directional, but has no override logic. Only can
     stream data in a two-way manner regardless of who made the update.
     """
-    pass
+    __slots__ = ()
 
 
 class OverridableVariable(StreamingVariable, SubscribableVariable):
@@ -289,9 +391,7 @@ class OverridableVariable(StreamingVariable, SubscribableVariable):
     by the user interface, but the override can be released for the controls
     to control
     """
-    def __init__(self, sensor_name, default=None):
-        super(OverridableVariable, self).__init__(sensor_name, default=default)
-        self.overridden = WeakKeyDictionary()
+    __slots__ = ()
 
     def register(self, client, instance, recipe_instance,
                  authtoken=None, callback=None):
@@ -302,7 +402,6 @@ class OverridableVariable(StreamingVariable, SubscribableVariable):
             client, instance, recipe_instance, authtoken=authtoken,
             callback=callback)
 
-        self.overridden[instance] = False
         self._subscribe(instance, recipe_instance,
                         variable_type=OVERRIDE_VARIABLE_TYPE)
 
@@ -311,50 +410,43 @@ class OverridableVariable(StreamingVariable, SubscribableVariable):
         place on the variable before allowing to go to the normal __set__
         """
         # See if the controls are allowed to set this value at the moment.
-        if self.overridden[obj]:
+        data = obj.__dict__
+        state = data[self.state_key]
+        if state.overridden:
             return
 
-        super(OverridableVariable, self).__set__(obj, value)
-
-    def on_message(self, response):
-        """A generic callback to handle the response from a websocket
-        communication back, which will receive the data and set it
-
-        Args:
-            response: The websocket response
-        """
-        response_data = json.loads(response)
-        headers = response_data['headers']
-        for serialized in response_data['data']:
-            self._handle_new_data(headers, serialized)
+        # Streamed here, rather than through StreamingVariable.__set__, so the
+        # instance's state is only looked up once per update.
+        data[self.data_key] = value
+        sensor = state.value_id
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug("Sending new value for %s: %s.", self.sensor_name,
+                         value)
+        state.client.update_sensor_value(state.recipe_instance, value, sensor)
 
-    def _handle_new_data(self, headers, serialized):
-        data = self.deserialize(headers, serialized)
+    def _make_handler(self, instance, variable_type):
+        if variable_type != OVERRIDE_VARIABLE_TYPE:
+            return super(OverridableVariable, self)._make_handler(
+                instance, variable_type)
 
-        sensor = data['sensor']
-        variable_type = self.variable_types.get(sensor, VALUE_VARIABLE_TYPE)
-        recipe_instance = data['recipe_instance']
-        subscriber_key = (sensor, variable_type, recipe_instance)
+        state = self.get_state(instance)
 
-        # TODO(willjschmitt): Handle subscribers in client.
-        if subscriber_key not in self.subscribers:
-            return
+        def handle_override(response_value):
+            state.overridden = bool(response_value)
 
-        LOGGER.debug("Received updated value for sensor %s(%s), variable_type"
-                     " %s, recipe_instance %s.", sensor, self.sensor_name,
-                     variable_type, recipe_instance)
-        subscriber = self.subscribers[subscriber_key]
+        return handle_override
 
-        response_value = data['value']
 
-        instance = subscriber['instance']
-
-        if variable_type == OVERRIDE_VARIABLE_TYPE:
-            self.overridden[instance] = bool(response_value)
-            return
-        else:
-            return super(OverridableVariable, self)._handle_new_data(
-                headers, serialized)
+def _multiple_attribute_getter(paths):
+    """Compiles dotted attribute paths into a single getter, which walks all
+    of them in C and returns a tuple of their values in the order of
+    ``paths``.
+    """
+    getter = operator.attrgetter(*paths)
+    if len(paths) == 1:
+        # attrgetter returns a bare value rather than a tuple for a single path.
+        return lambda obj: (getter(obj),)
+    return getter
 
 
 class DataStreamer(object):
@@ -373,7 +465,10 @@ class DataStreamer(object):
             store on server.
         id_to_attribute: A dictionary mapping the server variable id to
             attribute address (relative to instance).
-        poller: The PeriodicCallback object that performs the async polling.
+        sensor_ids: The server variable ids registered, in registration order.
+        getter: Precompiled getter retrieving a tuple of all of the registered
+            attributes from instance in a single call, ordered like
+            ``sensor_ids``. None until an attribute is registered.
     """
     # TODO(will): This should be deprecated as soon as the calculated variables
     # can automatically send data like a ManagedVariable. Right now, there are
@@ -382,6 +477,11 @@ class DataStreamer(object):
     # action. Since we have not event-driven basis. This class polls at a
     # regular interval and streams data regardless of change.
 
+    # Read on every poll, so slots keep the attributes quick to access.
+    __slots__ = ('client', 'instance', 'recipe_instance',
+                 'datastream_frequency', 'attribute_to_name', 'id_to_attribute',
+                 'sensor_ids', '_attribute_paths', 'getter', 'poller')
+
     def __init__(self, client, instance, recipe_instance, datastream_frequency):
         self.client = client
         self.instance = instance
@@ -390,6 +490,9 @@ class DataStreamer(object):
 
         self.attribute_to_name = {}
         self.id_to_attribute = {}
+        self.sensor_ids = []
+        self._attribute_paths = []
+        self.getter = None
 
         self.poller = ioloop.PeriodicCallback(
             self.post_data, self.datastream_frequency)
@@ -428,13 +531,26 @@ class DataStreamer(object):
 
         self.attribute_to_name[attr] = name
         self.id_to_attribute[identifier] = attr
+        # Resolve the dunderscore paths once, so polling is a single C-level
+        # walk over all of the attributes rather than re-parsing the paths and
+        # calling a getter per attribute every tick.
+        self.sensor_ids.append(identifier)
+        self._attribute_paths.append(attr.replace('__', '.'))
+        self.getter = _multiple_attribute_getter(self._attribute_paths)
 
     def post_data(self):
         """Posts the current values of the data to the server"""
-        LOGGER.debug('Data streamer %r sending data.', self)
-
-        for sensor_id, attr in self.id_to_attribute.items():
-            value = rgetattr(self.instance, attr)
-            LOGGER.debug("Sending new value for %s: %s.", attr, value)
-            self.client.update_sensor_value(
-                self.recipe_instance, value, sensor_id)
+        # Nothing to sample, so don't have the client take a timestamp or
+        # check its backoff for an empty batch every tick.
+        if self.getter is None:
+            return
+        # Handed to the client as an iterator, so a tick only builds a list of
+        # the pairs when they are logged.
+        values = zip(self.sensor_ids, self.getter(self.instance))
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            values = list(values)
+            LOGGER.debug('Data streamer %r sending data: %s.', self, values)
+
+        # All of the samples are handed over together, so the client can share
+        # a timestamp and its checks between them.
+        self.client.update_sensor_values(self.recipe_instance, values)
@@ -2,12 +2,19 @@
 """
 
 import json
+import re
 import unittest
+from unittest.mock import patch
 
+from joulia_webserver import serialization
 from testing.stub_joulia_webserver_client import StubJouliaHTTPClient
 from testing.stub_joulia_webserver_client import StubJouliaWebsocketClient
 import variables
 
+# Matches the ISO 8601 timestamps sent with sensor samples.
+DATETIME_REGEXP = re.compile(
+    r'\d{4}[-/]\d{2}[-/]\d{2}T\d{2}:\d{2}:\d{2}.\d{6}\+\d{2}:\d{2}')
+
 
 class TestManagedVariable(unittest.TestCase):
     """Tests for the variables.ManagedVariable class.
@@ -35,7 +42,18 @@ class TestManagedVariable(unittest.TestCase):
             foo = variables.ManagedVariable("foo", default=10)
         instance = TestClass()
 
-        self.assertEquals(instance.foo, 10)
+        self.assertEqual(instance.foo, 10)
+
+    def test_unset_get_stores_default(self):
+        """Checks the default is stored on the first get, so later gets find
+        it with a single lookup.
+        """
+        class TestClass(object):
+            foo = variables.ManagedVariable("foo", default=10)
+        instance = TestClass()
+
+        _ = instance.foo
+        self.assertEqual(instance.__dict__[TestClass.foo.data_key], 10)
 
     def test_set_and_get_one_instance(self):
         """Checks the simple case for a single ManagedVariable on a single
@@ -49,10 +67,10 @@ class TestManagedVariable(unittest.TestCase):
         TestClass.foo.register(self.http_client, instance, recipe_instance)
 
         instance.foo = 1
-        self.assertEquals(instance.foo, 1)
+        self.assertEqual(instance.foo, 1)
 
         instance.foo = 2
-        self.assertEquals(instance.foo, 2)
+        self.assertEqual(instance.foo, 2)
 
     def test_set_and_get_two_instance(self):
         """Makes sure multiple instances of a class with a ManagedVariable do
@@ -69,14 +87,14 @@ class TestManagedVariable(unittest.TestCase):
         # Edit instance2 then instance1
         instance2.foo = 3
         instance.foo = 1
-        self.assertEquals(instance.foo, 1)
-        self.assertEquals(instance2.foo, 3)
+        self.assertEqual(instance.foo, 1)
+        self.assertEqual(instance2.foo, 3)
 
         # Edit instance1 then instance2
         instance.foo = 2
         instance2.foo = 4
-        self.assertEquals(instance.foo, 2)
-        self.assertEquals(instance2.foo, 4)
+        self.assertEqual(instance.foo, 2)
+        self.assertEqual(instance2.foo, 4)
 
     def test_set_and_get_two_variables(self):
         """Makes sure multiple instances of a ManagedVariable in a single class
@@ -93,14 +111,56 @@ class TestManagedVariable(unittest.TestCase):
         # Edit bar then foo
         instance.bar = 3
         instance.foo = 1
-        self.assertEquals(instance.foo, 1)
-        self.assertEquals(instance.bar, 3)
+        self.assertEqual(instance.foo, 1)
+        self.assertEqual(instance.bar, 3)
 
         # Edit foo then bar
         instance.foo = 2
         instance.bar = 4
-        self.assertEquals(instance.foo, 2)
-        self.assertEquals(instance.bar, 4)
+        self.assertEqual(instance.foo, 2)
+        self.assertEqual(instance.bar, 4)
+
+    def test_set_and_get_two_variables_same_name(self):
+        """Makes sure ManagedVariables sharing a sensor name in a single class
+        do not share storage.
+        """
+        class TestClass(object):
+            foo = variables.ManagedVariable("x")
+            bar = variables.ManagedVariable("x")
+
+        instance = TestClass()
+        instance.foo = 1
+        instance.bar = 2
+        self.assertEqual(instance.foo, 1)
+        self.assertEqual(instance.bar, 2)
+
+    def test_value_stored_on_instance(self):
+        class TestClass(object):
+            foo = variables.ManagedVariable("foo")
+
+        instance = TestClass()
+        instance.foo = 1
+
+        self.assertEqual(instance.__dict__[TestClass.foo.data_key], 1)
+
+    def test_variables_have_no_instance_dict(self):
+        for variable_class in (variables.ManagedVariable,
+                               variables.StreamingVariable,
+                               variables.SubscribableVariable,
+                               variables.BidirectionalVariable,
+                               variables.OverridableVariable):
+            variable = variable_class("foo")
+            self.assertFalse(hasattr(variable, "__dict__"))
+
+    def test_instance_state_has_no_instance_dict(self):
+        class TestClass(object):
+            foo = variables.ManagedVariable("foo")
+
+        instance = TestClass()
+        TestClass.foo.register(self.http_client, instance, 0)
+
+        state = TestClass.foo.get_state(instance)
+        self.assertFalse(hasattr(state, "__dict__"))
 
     def test_get_class_object(self):
         class TestClass(object):
@@ -118,8 +178,9 @@ class TestManagedVariable(unittest.TestCase):
         recipe_instance = 0
         TestClass.foo.register(self.http_client, instance, recipe_instance)
 
-        self.assertEquals(TestClass.foo.clients[instance], self.http_client)
-        self.assertIn(instance, TestClass.foo.registered)
+        state = TestClass.foo.get_state(instance)
+        self.assertEqual(state.client, self.http_client)
+        self.assertIs(instance.__dict__[TestClass.foo.state_key], state)
 
     def test_identify(self):
         class TestClass(object):
@@ -134,9 +195,11 @@ class TestManagedVariable(unittest.TestCase):
         TestClass.foo.identify(
             instance, recipe_instance, variables.VALUE_VARIABLE_TYPE)
 
-        got = TestClass.foo.ids[(instance, variables.VALUE_VARIABLE_TYPE)]
+        got = TestClass.foo.get_state(instance).ids[
+            variables.VALUE_VARIABLE_TYPE]
         want = 11
-        self.assertEquals(got, want)
+        self.assertEqual(got, want)
+        self.assertEqual(TestClass.foo.get_state(instance).value_id, want)
 
 
 class TestWebsocketVariable(unittest.TestCase):
@@ -192,18 +255,35 @@ class TestStreamingVariable(unittest.TestCase):
         TestClass.foo.register(self.ws_client, instance, recipe_instance)
 
         instance.foo = 2
-        self.assertEquals(instance.foo, 2)
+        self.assertEqual(instance.foo, 2)
+        self.ws_client.flush_sensor_values()
 
-        date_regexp = r'\d{4}[-/]\d{2}[-/]\d{2}'
-        time_regexp = r'\d{2}:\d{2}:\d{2}.\d{6}\+\d{2}:\d{2}'
-        datetime_regexp = "{}T{}".format(date_regexp, time_regexp)
+        parsed = json.loads(self.ws_client.websocket.written_messages[0])
+        self.assertEqual(set(parsed),
+                         {'time', 'recipe_instance', 'value', 'sensor'})
+        self.assertRegex(parsed['time'], DATETIME_REGEXP)
+        self.assertEqual(parsed['recipe_instance'], recipe_instance)
+        self.assertEqual(parsed['value'], 2)
+        self.assertEqual(parsed['sensor'], 3)
 
-        got = self.ws_client.websocket.written_messages[0]
-        parsed = json.loads(got)
-        self.assertRegexpMatches(parsed['time'], datetime_regexp)
-        self.assertEquals(parsed['recipe_instance'], recipe_instance)
-        self.assertEquals(parsed['value'], 2)
-        self.assertEquals(parsed['sensor'], 3)
+    def test_set_two_variables_message_each(self):
+        class TestClass(object):
+            foo = variables.StreamingVariable("foo")
+            bar = variables.StreamingVariable("bar")
+
+        instance = TestClass()
+        self.ws_client.http_client.identifier = 3
+        TestClass.foo.register(self.ws_client, instance, 1)
+        TestClass.bar.register(self.ws_client, instance, 1)
+
+        instance.foo = 2
+        instance.bar = 5
+        self.ws_client.flush_sensor_values()
+
+        got = [json.loads(message)
+               for message in self.ws_client.websocket.written_messages]
+        self.assertEqual([(sample['sensor'], sample['value'])
+                          for sample in got], [(3, 2), (4, 5)])
 
 
 class TestSubscribableVariable(unittest.TestCase):
@@ -228,6 +308,15 @@ class TestSubscribableVariable(unittest.TestCase):
 
         self.assertIn(TestClass.foo.on_message, self.ws_client.callbacks)
 
+    def test_register_callback_once_for_many_instances(self):
+        class TestClass(object):
+            foo = variables.SubscribableVariable("foo")
+
+        for recipe_instance in (1, 2):
+            TestClass.foo.register(self.ws_client, TestClass(), recipe_instance)
+
+        self.assertEqual(self.ws_client.callbacks, {TestClass.foo.on_message})
+
     def test_subscribe(self):
         class TestClass(object):
             foo = variables.SubscribableVariable("foo")
@@ -240,11 +329,81 @@ class TestSubscribableVariable(unittest.TestCase):
         # Calls _subscribe
         TestClass.foo.register(self.ws_client, instance, recipe_instance)
 
-        self.assertIn((sensor_id, "value", recipe_instance),
-                      TestClass.foo.subscribers)
-        got = TestClass.foo.subscribers[(sensor_id, "value", recipe_instance)]
-        want = {"instance": instance}
-        self.assertEquals(got, want)
+        key = TestClass.foo._subscriber_key(sensor_id, recipe_instance)
+        self.assertIn(key, TestClass.foo.subscribers)
+        got = TestClass.foo.subscribers[key]
+        self.assertIs(got.instance, instance)
+        self.assertTrue(callable(got.handler))
+
+    def test_subscribe_replaces_subscribers(self):
+        class TestClass(object):
+            foo = variables.SubscribableVariable("foo")
+
+        self.http_client.identifier = 11
+        TestClass.foo.register(self.ws_client, TestClass(), 1)
+        before = TestClass.foo.subscribers
+
+        TestClass.foo.register(self.ws_client, TestClass(), 2)
+
+        self.assertIsNot(TestClass.foo.subscribers, before)
+        self.assertEqual(len(before), 1)
+        self.assertEqual(len(TestClass.foo.subscribers), 2)
+
+    def test_subscribe_id_too_large(self):
+        class TestClass(object):
+            foo = variables.SubscribableVariable("foo")
+
+        instance = TestClass()
+        self.http_client.identifier = 2**32
+
+        with self.assertRaises(ValueError):
+            TestClass.foo.register(self.ws_client, instance, 1)
+
+    def test_subscribe_negative_id(self):
+        class TestClass(object):
+            foo = variables.SubscribableVariable("foo")
+
+        instance = TestClass()
+        self.http_client.identifier = 3
+
+        with self.assertRaises(ValueError):
+            TestClass.foo.register(self.ws_client, instance, -1)
+
+    def test_on_message_sample_length_mismatch(self):
+        class TestClass(object):
+            foo = variables.SubscribableVariable("foo")
+
+        instance = TestClass()
+        self.http_client.identifier = 11
+        TestClass.foo.register(self.ws_client, instance, 1)
+
+        message = ('{'
+                   '"headers":["sensor","recipe_instance","value"],'
+                   '"data":[[11,1]]'
+                   '}')
+        with self.assertRaises(ValueError):
+            TestClass.foo.on_message(json.loads(message))
+
+    def test_on_message_parsed_once_for_all_variables(self):
+        class TestClass(object):
+            foo = variables.SubscribableVariable("foo")
+            bar = variables.SubscribableVariable("bar")
+
+        instance = TestClass()
+        self.http_client.identifier = 11
+        TestClass.foo.register(self.ws_client, instance, 1)
+        TestClass.bar.register(self.ws_client, instance, 1)
+
+        message = ('{'
+                   '"headers":["sensor","recipe_instance","value"],'
+                   '"data":[[11,1,2],[12,1,3]]'
+                   '}')
+        with patch.object(serialization, 'loads',
+                          side_effect=serialization.loads) as loads:
+            self.ws_client.on_message(message)
+        self.assertEqual(loads.call_count, 1)
+        self.assertEqual(instance.foo, 2)
+        self.assertEqual(instance.bar, 3)
 
     def test_on_message_nothing_set(self):
         class TestClass(object):
@@ -260,9 +419,9 @@ class TestSubscribableVariable(unittest.TestCase):
                    '"headers":["sensor","recipe_instance","value"],'
                    '"data":[[11,1,2]]'
                    '}')
-        TestClass.foo.on_message(message)
+        TestClass.foo.on_message(json.loads(message))
 
-        self.assertEquals(instance.foo, 2)
+        self.assertEqual(instance.foo, 2)
 
     def test_on_message_int_set(self):
         class TestClass(object):
@@ -280,10 +439,71 @@ class TestSubscribableVariable(unittest.TestCase):
                    '"headers":["sensor","recipe_instance","value"],'
                    '"data":[[11,1,2.0]]'
                    '}')
-        TestClass.foo.on_message(message)
+        TestClass.foo.on_message(json.loads(message))
 
         self.assertIsInstance(instance.foo, int)
-        self.assertEquals(instance.foo, 2)
+        self.assertEqual(instance.foo, 2)
+
+    def test_on_message_set_type_differs_from_default(self):
+        class TestClass(object):
+            foo = variables.SubscribableVariable("foo", default=1.0)
+
+        instance = TestClass()
+        recipe_instance = 1
+        self.http_client.identifier = 11
+
+        TestClass.foo.register(self.ws_client, instance, recipe_instance)
+
+        # The value set locally decides the type, not the default's.
+        instance.foo = True
+
+        message = ('{'
+                   '"headers":["sensor","recipe_instance","value"],'
+                   '"data":[[11,1,0.0]]'
+                   '}')
+        TestClass.foo.on_message(json.loads(message))
+
+        self.assertIs(instance.foo, False)
+
+    def test_on_message_same_type_set(self):
+        class TestClass(object):
+            foo = variables.SubscribableVariable("foo")
+
+        instance = TestClass()
+        recipe_instance = 1
+        self.http_client.identifier = 11
+
+        TestClass.foo.register(self.ws_client, instance, recipe_instance)
+
+        instance.foo = 3.0
+
+        message = ('{'
+                   '"headers":["sensor","recipe_instance","value"],'
+                   '"data":[[11,1,2.5]]'
+                   '}')
+        TestClass.foo.on_message(json.loads(message))
+
+        self.assertIsInstance(instance.foo, float)
+        self.assertEqual(instance.foo, 2.5)
+
+    def test_on_message_default_not_yet_read(self):
+        class TestClass(object):
+            foo = variables.SubscribableVariable("foo", default=False)
+
+        instance = TestClass()
+        recipe_instance = 1
+        self.http_client.identifier = 11
+
+        TestClass.foo.register(self.ws_client, instance, recipe_instance)
+
+        message = ('{'
+                   '"headers":["sensor","recipe_instance","value"],'
+                   '"data":[[11,1,1]]'
+                   '}')
+        TestClass.foo.on_message(json.loads(message))
+
+        self.assertIsInstance(instance.foo, bool)
+        self.assertEqual(instance.foo, True)
 
     def test_on_message_bool_set(self):
         class TestClass(object):
@@ -301,10 +521,10 @@ class TestSubscribableVariable(unittest.TestCase):
                    '"headers":["sensor","recipe_instance","value"],'
                    '"data":[[11,1,0]]'
                    '}')
-        TestClass.foo.on_message(message)
+        TestClass.foo.on_message(json.loads(message))
 
         self.assertIsInstance(instance.foo, bool)
-        self.assertEquals(instance.foo, False)
+        self.assertEqual(instance.foo, False)
 
     def test_on_message_calls_callback(self):
         class TestClass(object):
@@ -326,9 +546,9 @@ class TestSubscribableVariable(unittest.TestCase):
                    '"headers":["sensor","recipe_instance","value"],'
                    '"data":[[11,1,0]]'
                    '}')
-        TestClass.foo.on_message(message)
+        TestClass.foo.on_message(json.loads(message))
 
-        self.assertEquals(counters["bar"], 1)
+        self.assertEqual(counters["bar"], 1)
 
 
 class TestOverridableVariable(unittest.TestCase):
@@ -342,6 +562,14 @@ class TestOverridableVariable(unittest.TestCase):
         self.ws_client = StubJouliaWebsocketClient(
             self.ws_address, self.http_client)
 
+    def test_initializes_once(self):
+        with patch.object(variables.ManagedVariable, '__init__',
+                          autospec=True,
+                          side_effect=variables.ManagedVariable.__init__) \
+                as managed_init:
+            variables.OverridableVariable("foo")
+        self.assertEqual(managed_init.call_count, 1)
+
     def test_register(self):
         class TestClass(object):
             foo = variables.OverridableVariable("foo")
@@ -353,11 +581,26 @@ class TestOverridableVariable(unittest.TestCase):
         self.ws_client.http_client.identifier = sensor_id
         TestClass.foo.register(self.ws_client, instance, recipe_instance)
 
-        self.assertIn((sensor_id, "value", recipe_instance),
+        subscriber_key = TestClass.foo._subscriber_key
+        self.assertIn(subscriber_key(sensor_id, recipe_instance),
                       TestClass.foo.subscribers)
-        self.assertIn((override_id, "override", recipe_instance),
+        self.assertIn(subscriber_key(override_id, recipe_instance),
                       TestClass.foo.subscribers)
 
+    def test_register_subscribes_once_per_variable_type(self):
+        class TestClass(object):
+            foo = variables.OverridableVariable("foo")
+
+        instance = TestClass()
+        recipe_instance = 1
+        TestClass.foo.register(self.ws_client, instance, recipe_instance)
+
+        self.assertEqual(len(TestClass.foo.subscribers), 2)
+        self.assertEqual(len(self.ws_client.websocket.written_messages), 2)
+        self.assertEqual(
+            set(TestClass.foo.get_state(instance).ids),
+            {variables.VALUE_VARIABLE_TYPE, variables.OVERRIDE_VARIABLE_TYPE})
+
     def test_set_not_overridden(self):
         class TestClass(object):
             foo = variables.OverridableVariable("foo")
@@ -368,21 +611,19 @@ class TestOverridableVariable(unittest.TestCase):
         TestClass.foo.register(self.ws_client, instance, recipe_instance)
 
         instance.foo = 2
-        self.assertEquals(instance.foo, 2)
-
-        date_regexp = r'\d{4}[-/]\d{2}[-/]\d{2}'
-        time_regexp = r'\d{2}:\d{2}:\d{2}.\d{6}\+\d{2}:\d{2}'
-        datetime_regexp = "{}T{}".format(date_regexp, time_regexp)
+        self.assertEqual(instance.foo, 2)
+        self.ws_client.flush_sensor_values()
 
         # First two messages are for subscribing value and override. Third is
         # the actual sending of a new value
-        self.assertEquals(len(self.ws_client.websocket.written_messages), 3)
-        got = self.ws_client.websocket.written_messages[2]
-        parsed = json.loads(got)
-        self.assertRegexpMatches(parsed['time'], datetime_regexp)
-        self.assertEquals(parsed['recipe_instance'], recipe_instance)
-        self.assertEquals(parsed['value'], 2)
-        self.assertEquals(parsed['sensor'], 3)
+        self.assertEqual(len(self.ws_client.websocket.written_messages), 3)
+        parsed = json.loads(self.ws_client.websocket.written_messages[2])
+        self.assertEqual(set(parsed),
+                         {'time', 'recipe_instance', 'value', 'sensor'})
+        self.assertRegex(parsed['time'], DATETIME_REGEXP)
+        self.assertEqual(parsed['recipe_instance'], recipe_instance)
+        self.assertEqual(parsed['value'], 2)
+        self.assertEqual(parsed['sensor'], 3)
 
     def test_set_is_overridden(self):
         class TestClass(object):
@@ -393,15 +634,16 @@ class TestOverridableVariable(unittest.TestCase):
         self.ws_client.http_client.identifier = 3
         TestClass.foo.register(self.ws_client, instance, recipe_instance)
 
-        TestClass.foo.overridden[instance] = True
+        TestClass.foo.get_state(instance).overridden = True
 
         instance.foo = 22
-        self.assertEquals(instance.foo, 2)
+        self.assertEqual(instance.foo, 2)
+        self.ws_client.flush_sensor_values()
 
         # First two messages are for subscribing value and override. Third is
         # the actual sending of a new value, which we shouldn't see, since this
         # is overridden.
-        self.assertEquals(len(self.ws_client.websocket.written_messages), 2)
+        self.assertEqual(len(self.ws_client.websocket.written_messages), 2)
         for message in self.ws_client.websocket.written_messages:
             parsed = json.loads(message)
             self.assertIn("subscribe", parsed)
@@ -419,13 +661,13 @@ class TestOverridableVariable(unittest.TestCase):
 
         TestClass.foo.register(self.ws_client, instance, recipe_instance)
 
-        self.assertFalse(TestClass.foo.overridden[instance])
+        self.assertFalse(TestClass.foo.get_state(instance).overridden)
         message = ('{'
                    '"headers":["sensor","recipe_instance","value"],'
                    '"data":[[%s,1,2]]'
                    '}') % override_id
-        TestClass.foo.on_message(message)
-        self.assertTrue(TestClass.foo.overridden[instance])
+        TestClass.foo.on_message(json.loads(message))
+        self.assertTrue(TestClass.foo.get_state(instance).overridden)
 
     def test_on_message(self):
         class TestClass(object):
@@ -437,14 +679,14 @@ class TestOverridableVariable(unittest.TestCase):
 
         TestClass.foo.register(self.ws_client, instance, recipe_instance)
 
-        self.assertFalse(TestClass.foo.overridden[instance])
+        self.assertFalse(TestClass.foo.get_state(instance).overridden)
         message = ('{'
                    '"headers":["sensor","recipe_instance","value"],'
                    '"data":[[11,1,2]]'
                    '}')
-        TestClass.foo.on_message(message)
-        self.assertFalse(TestClass.foo.overridden[instance])
-        self.assertEquals(instance.foo, 2)
+        TestClass.foo.on_message(json.loads(message))
+        self.assertFalse(TestClass.foo.get_state(instance).overridden)
+        self.assertEqual(instance.foo, 2)
 
     def test_on_message_value(self):
         class TestClass(object):
@@ -456,14 +698,14 @@ class TestOverridableVariable(unittest.TestCase):
 
         TestClass.foo.register(self.ws_client, instance, recipe_instance)
 
-        self.assertFalse(TestClass.foo.overridden[instance])
+        self.assertFalse(TestClass.foo.get_state(instance).overridden)
         message = ('{'
                    '"headers":["sensor","recipe_instance","value"],'
                    '"data":[[11,1,2]]'
                    '}')
-        TestClass.foo.on_message(message)
-        self.assertFalse(TestClass.foo.overridden[instance])
-        self.assertEquals(instance.foo, 2)
+        TestClass.foo.on_message(json.loads(message))
+        self.assertFalse(TestClass.foo.get_state(instance).overridden)
+        self.assertEqual(instance.foo, 2)
 
 
 class TestBidirectionalVariable(unittest.TestCase):
@@ -488,9 +730,10 @@ class TestBidirectionalVariable(unittest.TestCase):
         self.ws_client.http_client.identifier = sensor_id
         TestClass.foo.register(self.ws_client, instance, recipe_instance)
 
-        self.assertIn((sensor_id, "value", recipe_instance),
+        subscriber_key = TestClass.foo._subscriber_key
+        self.assertIn(subscriber_key(sensor_id, recipe_instance),
                       TestClass.foo.subscribers)
-        self.assertIn((override_id, "override", recipe_instance),
+        self.assertIn(subscriber_key(override_id, recipe_instance),
                       TestClass.foo.subscribers)
 
     def test_on_message_override(self):
@@ -507,7 +750,11 @@ class TestBidirectionalVariable(unittest.TestCase):
                    '"headers":["sensor","recipe_instance","value","variable_type"],'
                    '"data":[[11,1,2,"override"]]'
                    '}')
-        TestClass.foo.on_message(message)
+        TestClass.foo.on_message(json.loads(message))
+
+        # There is no override subscription, so the value should be untouched.
+        with self.assertRaises(AttributeError):
+            _ = instance.foo
 
     def test_on_message(self):
         class TestClass(object):
@@ -523,8 +770,8 @@ class TestBidirectionalVariable(unittest.TestCase):
                    '"headers":["sensor","recipe_instance","value"],'
                    '"data":[[11,1,2]]'
                    '}')
-        TestClass.foo.on_message(message)
-        self.assertEquals(instance.foo, 2)
+        TestClass.foo.on_message(json.loads(message))
+        self.assertEqual(instance.foo, 2)
 
     def test_on_message_value(self):
         class TestClass(object):
@@ -540,8 +787,8 @@ class TestBidirectionalVariable(unittest.TestCase):
                    '"headers":["sensor","recipe_instance","value"],'
                    '"data":[[11,1,2]]'
                    '}')
-        TestClass.foo.on_message(message)
-        self.assertEquals(instance.foo, 2)
+        TestClass.foo.on_message(json.loads(message))
+        self.assertEqual(instance.foo, 2)
 
 
 class TestDataStreamer(unittest.TestCase):
@@ -561,7 +808,35 @@ class TestDataStreamer(unittest.TestCase):
             self.http_client, instance, recipe_instance, 1)
 
         streamer.start()
+        self.assertTrue(streamer.poller.is_running())
         streamer.stop()
+        self.assertFalse(streamer.poller.is_running())
+
+    def test_post_data_websocket_shared_time(self):
+        class TestClass(object):
+            foo = 1
+        ws_client = StubJouliaWebsocketClient("ws://fakehost", self.http_client)
+        first = variables.DataStreamer(ws_client, TestClass(), 0, 1)
+        second = variables.DataStreamer(ws_client, TestClass(), 0, 1)
+        self.http_client.identifier = 11
+        first.register("foo")
+        self.http_client.identifier = 12
+        second.register("foo")
+
+        first.post_data()
+        second.post_data()
+        ws_client.flush_sensor_values()
+
+        got = [json.loads(message)
+               for message in ws_client.websocket.written_messages]
+        self.assertEqual([sample['sensor'] for sample in got], [11, 12])
+        # Samples from both streamers polled in the same IOLoop iteration
+        # share a timestamp.
+        self.assertEqual(got[0]['time'], got[1]['time'])
+
+    def test_no_instance_dict(self):
+        streamer = variables.DataStreamer(self.http_client, object(), 0, 1)
+        self.assertFalse(hasattr(streamer, '__dict__'))
 
     def test_register(self):
         class TestClass(object):
@@ -574,8 +849,8 @@ class TestDataStreamer(unittest.TestCase):
 
         streamer.register("foo", "bar")
 
-        self.assertEquals(streamer.attribute_to_name["foo"], "bar")
-        self.assertEquals(streamer.id_to_attribute[11], "foo")
+        self.assertEqual(streamer.attribute_to_name["foo"], "bar")
+        self.assertEqual(streamer.id_to_attribute[11], "foo")
 
     def test_register_no_name(self):
         class TestClass(object):
@@ -588,8 +863,8 @@ class TestDataStreamer(unittest.TestCase):
 
         streamer.register("foo")
 
-        self.assertEquals(streamer.attribute_to_name["foo"], "foo")
-        self.assertEquals(streamer.id_to_attribute[11], "foo")
+        self.assertEqual(streamer.attribute_to_name["foo"], "foo")
+        self.assertEqual(streamer.id_to_attribute[11], "foo")
 
     def test_register_double_register_fails(self):
         class TestClass(object):
@@ -631,10 +906,42 @@ class TestDataStreamer(unittest.TestCase):
         want = {"recipe_instance": recipe_instance,
                 "value": 1,
                 "sensor": 11}
-        self.assertEquals(got, want)
+        self.assertEqual(got, want)
 
         got = updates[1]
         want = {"recipe_instance": recipe_instance,
                 "value": 2,
                 "sensor": 12}
-        self.assertEquals(got, want)
+        self.assertEqual(got, want)
+
+    def test_post_data_nothing_registered(self):
+        class TestClass(object):
+            pass
+        instance = TestClass()
+        streamer = variables.DataStreamer(self.http_client, instance, 0, 1)
+
+        streamer.post_data()
+
+        self.assertEqual(self.http_client.update_sensor_value_posts, [])
+
+    def test_post_data_nested_attribute(self):
+        class Child(object):
+            bar = 3
+
+        class TestClass(object):
+            foo = Child()
+        instance = TestClass()
+        recipe_instance = 0
+        streamer = variables.DataStreamer(
+            self.http_client, instance, recipe_instance, 1)
+
+        self.http_client.identifier = 11
+        streamer.register("foo__bar")
+
+        streamer.post_data()
+
+        got = self.http_client.update_sensor_value_posts[0]
+        want = {"recipe_instance": recipe_instance,
+                "value": 3,
+                "sensor": 11}
+        self.assertEqual(got, want)